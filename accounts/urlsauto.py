@@ -3,4 +3,6 @@ from django.conf.urls.defaults import *
 urlpatterns = patterns('accounts.views',
     url(r'^login/$', 'login'),
     url(r'^logout/$', 'logout'),
+    url(r'^welcome/(?P<user_key>[\w-]+)/(?P<token>[0-9a-f]+)/$',
+        'welcome'),
 )
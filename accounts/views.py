@@ -1,7 +1,13 @@
+import hmac
+import hashlib
+
+from google.appengine.ext import db
+
 from django import forms
 from django.conf import settings
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, Http404
 from django.contrib import auth
+from django.contrib.auth.models import User
 
 from ragendja.template import render_to_response
 
@@ -26,6 +32,33 @@ class LoginForm(forms.Form):
         return self.cleaned_data
 
 
+class PasswordForm(forms.Form):
+    password = forms.CharField(max_length=40,
+        widget=forms.PasswordInput(attrs={'class': 'text span-6 focus'}))
+    repeat = forms.CharField(max_length=40, label="Repeat password",
+        widget=forms.PasswordInput(attrs={'class': 'text span-6'}))
+
+    def clean(self):
+        password = self.cleaned_data.get('password', '')
+        if password and password != self.cleaned_data.get('repeat', ''):
+            raise forms.ValidationError("The passwords don't match.")
+        return self.cleaned_data
+
+
+def welcome_token(user):
+    """
+    Secret token for the link in the welcome message. It includes the
+    password hash, so it stops working once the password is set.
+    """
+    return hmac.new(settings.SECRET_KEY,
+                    '%s %s' % (user.key(), user.password),
+                    hashlib.sha1).hexdigest()
+
+
+def welcome_url(user):
+    return '/accounts/welcome/%s/%s/' % (user.key(), welcome_token(user))
+
+
 def login(request):
     login_form = LoginForm(request.POST or None)
     if login_form.is_valid():
@@ -46,3 +79,27 @@ def login(request):
 def logout(request):
     auth.logout(request)
     return render_to_response(request, 'accounts/logout.html', locals())
+
+
+def welcome(request, user_key, token):
+    """
+    Choose a password from the link in the welcome message, so that
+    passwords are never sent by email.
+    """
+    try:
+        user = User.get(user_key)
+    except db.BadKeyError:
+        user = None
+    if user is None or token != welcome_token(user):
+        raise Http404
+    password_form = PasswordForm(request.POST or None)
+    if password_form.is_valid():
+        password = password_form.cleaned_data['password']
+        user.set_password(password)
+        user.put()
+        user = auth.authenticate(username=user.email, password=password)
+        auth.login(request, user)
+        return HttpResponseRedirect(settings.LOGIN_REDIRECT_URL)
+    if password_form.errors.get('__all__', False):
+        password_error = password_form.errors['__all__'][0]
+    return render_to_response(request, 'accounts/welcome.html', locals())
@@ -1,6 +1,15 @@
+import time
+
 from django.http import HttpResponseRedirect
 
 from tags.models import Tag
+from tags import related, merge
+from tags.normalize import normalize
+from search import index as search_index
+from reminders import cache
+from suggestions import version
+
+MERGE_TIME = 5 # Seconds for each merged tag.
 
 
 def feedback_submitter(feedback, request_user):
@@ -11,71 +20,94 @@ def feedback_submitter(feedback, request_user):
 def reminder_owner(reminder, request_user):
     reminder.owner = request_user
     reminder.put()
+    cache.invalidate([request_user])
 
 
 def tag_suggestion_reverse(tag, suggestion):
+    old_tags = list(suggestion.tags)
     suggestion.tags.append(tag.key().name())
     suggestion.put()
+    related.update_tags(old_tags, suggestion.tags)
+    related.update_suggestion(suggestion)
+    search_index.index_suggestions([suggestion])
+    version.bump()
 
 
 def tag_suggestion_missing(tag, suggestion_key):
-    tag.suggestions.remove(suggestion_key)
-    tag.count = len(tag.suggestions)
-    if tag.count:
-        tag.put()
+    if suggestion_key in tag.suggestions:
+        tag.suggestions.remove(suggestion_key)
     else:
-        tag.delete()
+        tag.remove_member(suggestion_key)
+    tag.set_count(len(tag.get_member_names()))
 
 
 def tag_suggestion_duplicate(tag, count, suggestion_key):
-    while tag.suggestions.count(suggestion_key) > 1:
+    # Only the old list can have duplicates, members are unique.
+    while (suggestion_key in tag.suggestions and
+           tag.get_member_names().count(suggestion_key) > 1):
         tag.suggestions.remove(suggestion_key)
-    tag.count = len(tag.suggestions)
-    tag.put()
+    tag.set_count(len(tag.get_member_names()))
 
 
 def reminder_tag(problems):
     for text, reminder, tag in problems:
         reminder.tags.append(tag.key().name())
         reminder.put()
+    version.bump()
 
 
 def tag_count(tag, count, length):
-    tag.count = len(tag.suggestions)
-    if tag.count:
-        tag.put()
-    else:
-        tag.delete()
+    tag.set_count(len(tag.get_member_names()))
 
 
 def tag_created_none(tag, suggestion):
     tag.created = suggestion.created
     tag.put()
+    version.bump()
 
 
 def tag_created_later(tag, suggestion):
     tag.created = suggestion.created
     tag.put()
+    version.bump()
 
 
 def tag_empty(tag):
-    tag.delete()
+    tag.set_count(0)
+
+
+def tag_name(tag, name):
+    # Large tags continue on the merge status page.
+    job = merge.start(tag.key().name(), name)
+    merge.run(job, time.time() + MERGE_TIME)
 
 
 def suggestion_tag_missing(suggestion, tag_key):
+    name = normalize(tag_key)
+    if name != tag_key:
+        old_tags = list(suggestion.tags)
+        suggestion.tags = [tag_name for tag_name in suggestion.tags
+                           if tag_name != tag_key]
+        if name and name not in suggestion.tags:
+            suggestion.tags.append(name)
+        suggestion.put()
+        related.update_tags(old_tags, suggestion.tags)
+        search_index.index_suggestions([suggestion])
+        version.bump()
+        if not name:
+            return
+        tag_key = name
     tag = Tag.get_by_key_name(tag_key)
     if tag is None:
         tag = Tag(key_name=tag_key, count=0, suggestions=[])
-    tag.suggestions.append(suggestion.key().name())
-    tag.count = len(tag.suggestions)
     if tag.created is None or suggestion.created < tag.created:
         tag.created = suggestion.created
-    tag.put()
+    tag.add_member(suggestion.key().name())
+    tag.set_count(len(tag.get_member_names()))
 
 
 def suggestion_tag_reverse(suggestion, tag):
     if suggestion.key().name() is None:
         return
-    tag.suggestions.append(suggestion.key().name())
-    tag.count = len(tag.suggestions)
-    tag.put()
+    tag.add_member(suggestion.key().name())
+    tag.set_count(len(tag.get_member_names()))
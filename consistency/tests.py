@@ -231,6 +231,32 @@ class AdminTest(TestCase):
         response = self.client.get('/consistency/')
         self.assertFalse('tag_empty' in response.context['problems'])
 
+    def test_tag_name(self):
+        # Create a tag from before normalization.
+        Reminder(key_name='check-tires', title='Check tires',
+                 tags=['tires']).put()
+        tag = Tag(key_name='tires', count=0)
+        tag.put()
+        tag.add_member('check-tires')
+        tag.set_count(1)
+        # Check that the tag name is detected.
+        response = self.client.get('/consistency/')
+        self.assertTrue('tag_name' in response.context['problems'])
+        self.assertTrue("Tag tires should be named tire."
+                        in response.content)
+        # Simulate button click to fix this problem.
+        response = self.client.post('/consistency/', {
+                'tag_name': "Merge into normalized tags"})
+        self.assertRedirects(response, '/consistency/')
+        # Check that the tag was renamed.
+        self.assertEqual(Tag.get_by_key_name('tires'), None)
+        self.assertEqual(Tag.get_by_key_name('tire').get_member_names(),
+                         ['check-tires'])
+        self.assertEqual(Reminder.get_by_key_name('check-tires').tags,
+                         ['tire'])
+        response = self.client.get('/consistency/')
+        self.assertFalse('tag_name' in response.context['problems'])
+
     def test_suggestion_tag_missing(self):
         self.assertEqual(Tag.all().count(), 0)
         # Create a reminder but not the tags.
@@ -275,7 +301,7 @@ class AdminTest(TestCase):
         # Check that the tags are now existing.
         self.assertEqual(Reminder.all().count(), 2)
         self.assertEqual(Tag.all().count(), 2)
-        self.assertEqual(len(Tag.get_by_key_name('b').suggestions), 2)
+        self.assertEqual(len(Tag.get_by_key_name('b').get_member_names()), 2)
         response = self.client.get('/consistency/')
         self.assertFalse('suggestion_tag_reverse'
                          in response.context['problems'])
@@ -10,8 +10,10 @@ from django.contrib.auth.models import User
 
 from ragendja.template import render_to_response
 
+from utils.cron import cron_or_staff
 from reminders.models import Reminder
-from tags.models import Tag
+from tags.models import Tag, TagMember
+from tags.normalize import normalize
 from feedback.models import Feedback
 
 from consistency import repair
@@ -25,6 +27,7 @@ PROBLEM_MESSAGES = {
     'tag_created_later': "Tag %s was created after suggestion %s.",
     'tag_created_none': "Tag %s is missing a timestamp.",
     'tag_empty': "Tag %s does not reference any suggestions.",
+    'tag_name': "Tag %s should be named %s.",
     'tag_suggestion_missing': "Tag %s references missing suggestion %s.",
     'tag_suggestion_reverse': "Tag %s references %s but not reverse.",
     'tag_suggestion_duplicate': "Tag %s has %d references for %s.",
@@ -40,6 +43,7 @@ PROBLEM_HEADLINES = {
     'tag_created_later': "Incorrect tag timestamps",
     'tag_created_none': "Missing tag timestamps",
     'tag_empty': "Empty tags",
+    'tag_name': "Tags that are not normalized",
     'tag_suggestion_missing': "References to missing suggestions",
     'tag_suggestion_reverse': "Missing reverse references",
     'tag_suggestion_duplicate': "Duplicate tag-suggestions references",
@@ -55,40 +59,49 @@ PROBLEM_BUTTONS = {
     'tag_created_later': "Adjust timestamps",
     'tag_created_none': "Adjust timestamps",
     'tag_empty': "Delete empty tags",
+    'tag_name': "Merge into normalized tags",
     'tag_suggestion_missing': "Delete dangling references",
     'tag_suggestion_reverse': "Create missing references",
     'tag_suggestion_duplicate': "Delete duplicate references",
     }
 
 
+@cron_or_staff
 def index(request):
     """
     Check reminders and tags for consistency.
     """
-    if (request.META.get('HTTP_X_APPENGINE_CRON', '') != 'true'
-        and not request.user.is_staff):
-        return HttpResponseRedirect('/accounts/login/?next=/consistency/')
-
     # Get all tags and suggestions from the datastore.
     tag_dict = dict((tag.key().name(), tag) for tag in Tag.all())
     suggestion_dict = dict((suggestion.key().name(), suggestion)
         for suggestion in Reminder.all().filter('owner', None))
 
+    # Suggestion names for each tag, from old lists and from members.
+    member_dict = dict((tag_key, list(tag.suggestions))
+                       for tag_key, tag in tag_dict.items())
+    for key in TagMember.all(keys_only=True):
+        member_dict.setdefault(key.parent().name(), []).append(key.name())
+
     # Initialize empty problems dict.
     problems = dict((problem, []) for problem in PROBLEM_MESSAGES)
 
     # Check all tags.
+    Tag.prefetch_totals(tag_dict.values())
     for tag_key, tag in tag_dict.items():
-        if tag.count != len(tag.suggestions):
+        members = member_dict[tag_key]
+        if tag.get_total() != len(members):
             problems['tag_count'].append(
-                (tag, tag.count, len(tag.suggestions)))
-        elif tag.count == 0:
+                (tag, tag.get_total(), len(members)))
+        elif tag.get_total() == 0:
             problems['tag_empty'].append((tag, ))
+        name = normalize(tag_key)
+        if name and name != tag_key:
+            problems['tag_name'].append((tag, name))
         oldest = None
-        for suggestion_key in tag.suggestions:
-            if tag.suggestions.count(suggestion_key) > 1:
+        for suggestion_key in members:
+            if members.count(suggestion_key) > 1:
                 problems['tag_suggestion_duplicate'].append(
-                    (tag, tag.suggestions.count(suggestion_key),
+                    (tag, members.count(suggestion_key),
                      suggestion_key))
             if suggestion_key not in suggestion_dict:
                 problems['tag_suggestion_missing'].append(
@@ -113,7 +126,7 @@ def index(request):
                     (suggestion, tag_key))
                 continue
             tag = tag_dict[tag_key]
-            if suggestion.key().name() not in tag.suggestions:
+            if suggestion.key().name() not in member_dict[tag_key]:
                 problems['suggestion_tag_reverse'].append((suggestion, tag))
 
     # Check all feedback submitters.
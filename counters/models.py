@@ -0,0 +1,11 @@
+from google.appengine.ext import db
+
+
+class CounterShard(db.Model):
+    """
+    One shard of a named counter. The key name is the counter name
+    and the shard index, separated by a slash. Each shard is its own
+    entity group, so concurrent increments rarely collide.
+    """
+    name = db.StringProperty(required=True)
+    count = db.IntegerProperty(default=0)
@@ -0,0 +1,100 @@
+"""
+Sharded counters with a cached total.
+
+increment() adds to a random shard inside a transaction. The total
+is the sum of all shards, cached in memcache and kept up to date by
+increment(), so reading a counter usually costs one memcache call.
+The shards are not read in a transaction, so an increment between
+the read and the cache write can be missed; the cached total
+expires after CACHE_TIME seconds to bound that error.
+"""
+import random
+
+from google.appengine.api import memcache
+from google.appengine.ext import db
+
+from counters.models import CounterShard
+
+NUM_SHARDS = 10
+CACHE_KEY = 'counter:%s'
+CACHE_TIME = 60 # Seconds.
+
+
+def shard_keys(name):
+    return [db.Key.from_path(CounterShard.kind(), '%s/%d' % (name, index))
+            for index in range(NUM_SHARDS)]
+
+
+def increment(name, delta=1):
+    """
+    Add delta to a random shard of the named counter.
+    """
+    index = random.randint(0, NUM_SHARDS - 1)
+    key_name = '%s/%d' % (name, index)
+    db.run_in_transaction(add_to_shard, key_name, name, delta)
+    if delta >= 0:
+        memcache.incr(CACHE_KEY % name, delta)
+    else:
+        memcache.delete(CACHE_KEY % name)
+
+
+def increment_multi(deltas):
+    """
+    Add the deltas in a dict of counter names to a random shard of
+    each counter. Each shard is its own entity group, so this is one
+    small transaction per counter, and the cached totals are dropped
+    with one memcache call.
+    """
+    for name, delta in deltas.items():
+        key_name = '%s/%d' % (name, random.randint(0, NUM_SHARDS - 1))
+        db.run_in_transaction(add_to_shard, key_name, name, delta)
+    memcache.delete_multi([CACHE_KEY % name for name in deltas])
+
+
+def add_to_shard(key_name, name, delta):
+    shard = CounterShard.get_by_key_name(key_name)
+    if shard is None:
+        shard = CounterShard(key_name=key_name, name=name)
+    shard.count += delta
+    shard.put()
+
+
+def get_count(name):
+    return get_counts([name])[0]
+
+
+def get_counts(names):
+    """
+    Totals for many counters, with one memcache call and one datastore
+    call per hundred counters that are not cached.
+    """
+    cached = memcache.get_multi([CACHE_KEY % name for name in names])
+    missing = [name for name in names if CACHE_KEY % name not in cached]
+    for start in range(0, len(missing), 100):
+        chunk = missing[start:start + 100]
+        keys = []
+        for name in chunk:
+            keys.extend(shard_keys(name))
+        shards = db.get(keys)
+        totals = {}
+        for index, name in enumerate(chunk):
+            totals[CACHE_KEY % name] = sum([
+                shard.count for shard in
+                shards[index * NUM_SHARDS:(index + 1) * NUM_SHARDS]
+                if shard is not None])
+        # Don't replace a total that a concurrent reader cached first.
+        memcache.add_multi(totals, time=CACHE_TIME)
+        cached.update(totals)
+    return [cached[CACHE_KEY % name] for name in names]
+
+
+def reset(name):
+    """
+    Delete all shards of the named counter, e.g. after folding the
+    total into a stored count.
+    """
+    keys = [shard.key() for shard in db.get(shard_keys(name))
+            if shard is not None]
+    if keys:
+        db.delete(keys)
+    memcache.delete(CACHE_KEY % name)
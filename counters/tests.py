@@ -0,0 +1,42 @@
+from google.appengine.api import memcache
+
+from django.test import TestCase
+
+from counters import shards
+from counters.models import CounterShard
+
+
+class ShardTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+
+    def test_increment(self):
+        self.assertEqual(shards.get_count('a'), 0)
+        for index in range(25):
+            shards.increment('a')
+        shards.increment('b', 5)
+        self.assertEqual(shards.get_count('a'), 25)
+        self.assertEqual(shards.get_counts(['b', 'a', 'c']), [5, 25, 0])
+        self.assertTrue(CounterShard.all().count() <= shards.NUM_SHARDS + 1)
+
+    def test_cached_total(self):
+        shards.increment('a', 3)
+        self.assertEqual(shards.get_count('a'), 3)
+        # Increments keep the cached total up to date.
+        shards.increment('a', 2)
+        self.assertEqual(memcache.get(shards.CACHE_KEY % 'a'), 5)
+        shards.increment('a', -1)
+        self.assertEqual(shards.get_count('a'), 4)
+
+    def test_increment_multi(self):
+        shards.increment('a', 3)
+        self.assertEqual(shards.get_count('a'), 3)
+        shards.increment_multi({'a': -1, 'b': 2})
+        self.assertEqual(shards.get_counts(['a', 'b']), [2, 2])
+
+    def test_reset(self):
+        shards.increment('a', 3)
+        shards.reset('a')
+        self.assertEqual(shards.get_count('a'), 0)
+        self.assertEqual(CounterShard.all().count(), 0)
@@ -1,6 +1,12 @@
+from google.appengine.api import memcache
+
 from django.test import TestCase
 from django.contrib.auth.models import User
 
+from reminders.models import Reminder
+from tags.models import Tag
+from tags import related
+
 
 class AnonymousTest(TestCase):
 
@@ -37,3 +43,49 @@ class AdminTest(TestCase):
     def test_admin(self):
         response = self.client.get('/dashboard/')
         self.assertEqual(response.status_code, 200)
+
+    def test_submit_suggestion(self):
+        memcache.flush_all()
+        Tag(key_name='home', count=1, suggestions=['other']).put()
+        response = self.client.post('/dashboard/', {
+                'title': "Replace smoke alarm batteries",
+                'slug': 'replace-smoke-alarm-batteries',
+                'tags': 'home safety', 'years': 1})
+        self.assertRedirects(response,
+                             '/suggestions/replace-smoke-alarm-batteries/')
+        suggestion = Reminder.get_by_key_name('replace-smoke-alarm-batteries')
+        self.assertEqual(suggestion.tags, ['home', 'safety'])
+        home = Tag.get_by_key_name('home')
+        self.assertEqual(home.get_member_names(),
+                         ['other', 'replace-smoke-alarm-batteries'])
+        self.assertEqual(home.get_total(), 2)
+        self.assertEqual(Tag.get_by_key_name('safety').get_total(), 1)
+
+    def test_submit_suggestion_twice(self):
+        memcache.flush_all()
+        data = {'title': "Water the plants", 'slug': 'water-the-plants',
+                'tags': 'home Gardens home', 'days': 3}
+        self.client.post('/dashboard/', data)
+        self.client.post('/dashboard/', data)
+        suggestion = Reminder.get_by_key_name('water-the-plants')
+        self.assertEqual(suggestion.tags, ['home', 'garden'])
+        for tag_name in ('home', 'garden'):
+            tag = Tag.get_by_key_name(tag_name)
+            self.assertEqual(tag.get_member_names(), ['water-the-plants'])
+            self.assertEqual(tag.get_total(), 1)
+
+    def test_edit_suggestion(self):
+        memcache.flush_all()
+        data = {'title': "Water the plants", 'slug': 'water-the-plants',
+                'tags': 'home garden', 'days': 3}
+        self.client.post('/dashboard/', data)
+        data['tags'] = 'garden balcony'
+        self.client.post('/dashboard/', data)
+        home = Tag.get_by_key_name('home')
+        self.assertEqual(home.get_member_names(), [])
+        self.assertEqual(home.get_total(), 0)
+        self.assertEqual(Tag.get_by_key_name('balcony').get_member_names(),
+                         ['water-the-plants'])
+        self.assertEqual(related.get_related_tags('garden'),
+                         [('balcony', 1)])
+        self.assertEqual(related.get_related_tags('home'), [])
@@ -1,6 +1,8 @@
 import logging
 from datetime import datetime, timedelta
 
+from google.appengine.ext import db
+
 from django import forms
 from django.http import HttpResponseRedirect
 from django.contrib.auth.models import User
@@ -9,10 +11,16 @@ from ragendja.template import render_to_response
 from ragendja.auth.decorators import staff_only
 
 from reminders.models import Reminder
-from tags.models import Tag
+from reminders import cache as reminder_cache
+from tags.models import Tag, TagMember, tag_key, member_key
+from tags import related
+from tags.normalize import normalize_tags
 from feedback.models import Feedback
+from suggestions import summary, version
+from search import index as search_index
 
 RECENT_LIMIT = 5
+PUT_ATTEMPTS = 3
 
 
 class SuggestionForm(forms.Form):
@@ -24,7 +32,8 @@ class SuggestionForm(forms.Form):
     slug = forms.CharField(max_length=120,
         widget=forms.TextInput(attrs={'class': 'text span-12'}))
     tags = forms.CharField(max_length=120,
-        widget=forms.TextInput(attrs={'class': 'text span-12'}))
+        widget=forms.TextInput(
+            attrs={'class': 'text span-12 autocomplete'}))
     days = forms.IntegerField(required=False,
         widget=forms.TextInput(attrs={'class': 'text span-1'}))
     months = forms.IntegerField(required=False,
@@ -72,6 +81,9 @@ def index(request):
     user_count_7d = User.all().filter('date_joined >', week).count()
     user_list = User.all().order('-date_joined').fetch(RECENT_LIMIT)
 
+    # Check that the reminder list cache is working.
+    cache_hits, cache_misses = reminder_cache.get_stats()
+
     # Show newest feedback.
     # feedback_count = Feedback.all().count()
     # feedback_count_24h = Feedback.all().filter('submitted >', day).count()
@@ -85,14 +97,7 @@ def submit_suggestion(request, suggestion_form):
     Save a new suggestion in the database.
     """
     slug = suggestion_form.cleaned_data['slug']
-    tag_list = suggestion_form.cleaned_data['tags'].split()
-    for tag_name in tag_list:
-        tag = Tag.get_by_key_name(tag_name)
-        if tag is None:
-            tag = Tag(key_name=tag_name, count=0)
-        tag.suggestions.append(slug)
-        tag.count += 1
-        tag.put()
+    tag_list = normalize_tags(suggestion_form.cleaned_data['tags'])
     suggestion = Reminder(
         key_name=slug,
         title=suggestion_form.cleaned_data['title'],
@@ -103,5 +108,82 @@ def submit_suggestion(request, suggestion_form):
         kilometers=suggestion_form.cleaned_data['kilometers'],
         tags=tag_list)
     logging.debug(suggestion)
-    suggestion.put()
+    added = []
+    removed = []
+    previous = {}
+    for attempt in range(PUT_ATTEMPTS):
+        try:
+            save_suggestion(suggestion, tag_list, added, removed, previous)
+            break
+        except db.Timeout:
+            if attempt == PUT_ATTEMPTS - 1:
+                raise
+            logging.warning("Timeout saving suggestion %s, retrying." % slug)
+    summary.invalidate([slug])
+    Tag.increment_all([(tag, 1) for tag in added] +
+                      [(tag, -1) for tag in removed])
+    related.update_tags(previous['tags'], tag_list)
+    related.update_suggestion(suggestion)
+    search_index.index_suggestions([suggestion])
+    version.bump()
     return HttpResponseRedirect(suggestion.get_absolute_url())
+
+
+def save_suggestion(suggestion, tag_list, added, removed, previous):
+    """
+    Save the suggestion, new tags and new tag members with one batch
+    get and one batch put. The tags are in different entity groups,
+    so this can't be a transaction, but it is safe to repeat after a
+    timeout: existing members are left alone. Tags that got a new
+    member are appended to the added list, and tags that lost one to
+    the removed list, for the counter updates.
+
+    If the slug already exists, the stored tags are saved in
+    previous['tags'] on the first attempt. If some of them were
+    dropped, their tags and members cost one more batch get, and
+    the old members are deleted before the new version is saved.
+    """
+    slug = suggestion.key().name()
+    count = len(tag_list)
+    entities = db.get([suggestion.key()] +
+                      [tag_key(tag_name) for tag_name in tag_list] +
+                      [member_key(tag_name, slug) for tag_name in tag_list])
+    stored = entities[0]
+    if 'tags' not in previous:
+        previous['tags'] = stored and list(stored.tags) or []
+    new_entities = []
+    added_names = [tag.key().name() for tag in added]
+    removed_names = [tag.key().name() for tag in removed]
+    for tag_name, tag, member in zip(tag_list, entities[1:count + 1],
+                                     entities[count + 1:]):
+        if tag is None:
+            tag = Tag(key_name=tag_name, count=0)
+            new_entities.append(tag)
+        if member is None and slug not in tag.suggestions:
+            new_entities.append(TagMember(parent=tag, key_name=slug))
+            if tag_name not in added_names:
+                added.append(tag)
+    dropped = [tag_name for tag_name in previous['tags']
+               if tag_name not in tag_list]
+    if dropped:
+        count = len(dropped)
+        entities = db.get([tag_key(tag_name) for tag_name in dropped] +
+                          [member_key(tag_name, slug)
+                           for tag_name in dropped])
+        old_members = []
+        for tag_name, tag, member in zip(dropped, entities[:count],
+                                         entities[count:]):
+            if tag is None:
+                continue
+            if member is not None:
+                old_members.append(member.key())
+            elif slug in tag.suggestions:
+                tag.suggestions.remove(slug)
+                new_entities.append(tag)
+            else:
+                continue
+            if tag_name not in removed_names:
+                removed.append(tag)
+        if old_members:
+            db.delete(old_members)
+    db.put([suggestion] + new_entities)
@@ -0,0 +1,65 @@
+"""
+Maintain the hourly index of due reminders.
+"""
+from google.appengine.ext import db
+
+from dispatch.models import DueBucket
+
+
+def bucket_name(when):
+    return when.strftime('%Y%m%d%H')
+
+
+def due_buckets(now):
+    """
+    All buckets up to and including the current hour, oldest first.
+    """
+    last = db.Key.from_path(DueBucket.kind(), bucket_name(now))
+    return DueBucket.all().filter('__key__ <=', last).order('__key__')
+
+
+def update(changes):
+    """
+    Move reminders between buckets. Each change is a tuple of
+    (key, old_next, new_next) where either datetime may be None.
+    """
+    additions = {}
+    removals = {}
+    for key, old_next, new_next in changes:
+        old_name = old_next and bucket_name(old_next)
+        new_name = new_next and bucket_name(new_next)
+        if old_name == new_name:
+            continue
+        if old_name:
+            removals.setdefault(old_name, []).append(key)
+        if new_name:
+            additions.setdefault(new_name, []).append(key)
+    apply(additions, removals)
+
+
+def apply(additions, removals):
+    """
+    Add and remove keys with one transaction per affected bucket.
+    """
+    for name in set(additions) | set(removals):
+        db.run_in_transaction(update_bucket, name,
+                              additions.get(name, []),
+                              removals.get(name, []))
+
+
+def update_bucket(name, added, removed):
+    bucket = DueBucket.get_by_key_name(name)
+    if bucket is None:
+        bucket = DueBucket(key_name=name)
+    removed = set(removed)
+    keys = [key for key in bucket.reminders if key not in removed]
+    present = set(keys)
+    for key in added:
+        if key not in present:
+            keys.append(key)
+            present.add(key)
+    bucket.reminders = keys
+    if keys:
+        bucket.put()
+    elif bucket.is_saved():
+        bucket.delete()
@@ -0,0 +1,11 @@
+from google.appengine.ext import db
+
+
+class DueBucket(db.Model):
+    """
+    Keys of all reminders that are due in the same hour. The key name
+    is the hour in YYYYMMDDHH format, so that buckets sort by time.
+    The dispatcher reads one bucket at a time and removes each key
+    when it was sent, so that each bucket works as its own cursor.
+    """
+    reminders = db.ListProperty(db.Key, indexed=False)
@@ -0,0 +1,152 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core import mail
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from reminders.models import Reminder
+
+from dispatch import buckets, views
+from dispatch.models import DueBucket
+
+
+class AnonymousTest(TestCase):
+
+    def test_anonymous(self):
+        response = self.client.get('/dispatch/')
+        self.assertRedirects(response, '/accounts/login/?next=/dispatch/')
+
+
+class CronTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'user@example.com',
+                                             'pass')
+
+    def test_nothing_due(self):
+        response = self.client.get('/dispatch/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.failUnlessEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertTrue("Queued 0 messages for 0 reminders."
+                        in response.content)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def schedule(self, reminder):
+        reminder.put()
+        buckets.update([(reminder.key(), None, reminder.next)])
+
+    def send_queued(self):
+        self.client.get('/mailqueue/', HTTP_X_APPENGINE_CRON='true')
+
+    def test_due(self):
+        due = datetime.now() - timedelta(hours=1)
+        self.schedule(Reminder(key_name='due', title="Check tire pressure",
+                               days=14, next=due, owner=self.user))
+        self.schedule(Reminder(key_name='later', title="Change oil",
+                               months=3, next=due + timedelta(days=30),
+                               owner=self.user))
+        self.assertEqual(DueBucket.all().count(), 2)
+        response = self.client.get('/dispatch/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Queued 1 messages for 1 reminders."
+                        in response.content)
+        self.send_queued()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        self.assertTrue("Check tire pressure" in mail.outbox[0].subject)
+        reminder = Reminder.get_by_key_name('due')
+        self.assertEqual(reminder.previous, due)
+        self.assertEqual(reminder.next, due + timedelta(days=14))
+        # The sent bucket is gone, the next occurrence has a new one.
+        self.assertEqual(DueBucket.get_by_key_name(
+                buckets.bucket_name(due)), None)
+        self.assertEqual(DueBucket.get_by_key_name(
+                buckets.bucket_name(reminder.next)).reminders,
+                         [reminder.key()])
+
+    def test_stale(self):
+        # Bucket entry for a reminder that was rescheduled later.
+        due = datetime.now() - timedelta(hours=1)
+        reminder = Reminder(title="Water plants", days=3,
+                            next=due + timedelta(days=2), owner=self.user)
+        reminder.put()
+        buckets.update([(reminder.key(), None, due)])
+        response = self.client.get('/dispatch/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Queued 0 messages for 0 reminders."
+                        in response.content)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(DueBucket.all().count(), 0)
+
+    def test_digest(self):
+        due = datetime.now() - timedelta(hours=2)
+        for index in range(3):
+            self.schedule(Reminder(title="Reminder %d" % index, days=1,
+                                   next=due + timedelta(minutes=index),
+                                   owner=self.user))
+        other = User.objects.create_user('other', 'other@example.com',
+                                         'pass')
+        self.schedule(Reminder(title="Other reminder", years=1, next=due,
+                               owner=other))
+        response = self.client.get('/dispatch/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Queued 2 messages for 4 reminders."
+                        in response.content)
+        self.send_queued()
+        self.assertEqual(len(mail.outbox), 2)
+        digest = [message for message in mail.outbox
+                  if message.to == ['user@example.com']][0]
+        self.assertEqual(digest.subject, "3 reminders")
+        for index in range(3):
+            self.assertTrue("Reminder %d" % index in digest.body)
+        single = [message for message in mail.outbox
+                  if message.to == ['other@example.com']][0]
+        self.assertEqual(single.subject, "Reminder: Other reminder")
+
+    def test_digest_across_batches(self):
+        due = datetime.now() - timedelta(hours=3)
+        for index in range(3):
+            # In three batches of one, in two different buckets.
+            self.schedule(Reminder(title="Reminder %d" % index, days=1,
+                                   next=due + timedelta(hours=index / 2),
+                                   owner=self.user))
+        self.assertEqual(DueBucket.all().count(), 2)
+        views.BATCH_SIZE, batch_size = 1, views.BATCH_SIZE
+        try:
+            queued, count, finished = views.dispatch(time.time() + 10)
+        finally:
+            views.BATCH_SIZE = batch_size
+        self.assertEqual((queued, count, finished), (1, 3, True))
+        self.send_queued()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "3 reminders")
+        self.assertEqual(buckets.due_buckets(datetime.now()).count(), 0)
+
+    def test_deadline(self):
+        due = datetime.now() - timedelta(hours=1)
+        for index in range(2):
+            self.schedule(Reminder(title="Reminder %d" % index, days=1,
+                                   next=due, owner=self.user))
+        clock = iter([0, 10])
+        views.BATCH_SIZE, batch_size = 1, views.BATCH_SIZE
+        views.time, module = FakeTime(clock), views.time
+        try:
+            queued, count, finished = views.dispatch(5)
+        finally:
+            views.BATCH_SIZE, views.time = batch_size, module
+        # The first batch is saved even though the run was cut short.
+        self.assertEqual((queued, count, finished), (1, 1, False))
+        self.assertEqual(Reminder.all().filter('previous', due).count(), 1)
+        self.assertEqual(len(DueBucket.get_by_key_name(
+                    buckets.bucket_name(due)).reminders), 1)
+
+
+class FakeTime(object):
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def time(self):
+        return self.clock.next()
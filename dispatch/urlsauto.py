@@ -0,0 +1,5 @@
+from django.conf.urls.defaults import *
+
+urlpatterns = patterns('dispatch.views',
+    (r'^$', 'index'),
+)
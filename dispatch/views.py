@@ -0,0 +1,176 @@
+import logging
+import time
+from datetime import datetime
+
+from google.appengine.ext import db
+
+from django.conf import settings
+from django.core import mail
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from utils.cron import cron_or_staff, TIME_BUDGET
+from reminders.models import Reminder
+from reminders.recurrence import advance_all
+from reminders import cache
+
+from mailqueue import outbox
+
+from dispatch import buckets
+
+BATCH_SIZE = 50
+DIGEST = True # One message per user per run, instead of per reminder.
+
+
+@cron_or_staff
+def index(request):
+    """
+    Queue email for all due reminders, called by cron.
+    """
+    # Half of the budget for reading, the rest for queueing and saving.
+    queued, count, finished = dispatch(time.time() + TIME_BUDGET / 2)
+    message = "Queued %d messages for %d reminders." % (queued, count)
+    if not finished:
+        message += " Out of time, will resume on the next run."
+    return HttpResponse(message + '\n', mimetype="text/plain")
+
+
+def dispatch(deadline, digest=DIGEST):
+    """
+    Read the due buckets, oldest first, in batches until none are left
+    or the deadline is reached. Then queue the messages for everything
+    that was read, grouped by owner across all buckets, and save each
+    batch on its own, so that a run that is cut short while saving
+    keeps the progress of the saved batches.
+
+    Returns the number of queued messages, the number of due reminders,
+    and whether all due buckets were finished.
+    """
+    now = datetime.now()
+    batches, finished = collect_batches(now, deadline)
+    reminder_list = []
+    for name, due, removed in batches:
+        reminder_list.extend(due)
+    owner_list = get_owners(reminder_list)
+    if digest:
+        messages = digest_messages(reminder_list, owner_list)
+    else:
+        messages = single_messages(reminder_list, owner_list)
+    # Queue before saving: a failed put repeats a message, not loses it.
+    outbox.enqueue_messages(messages)
+    for name, due, removed in batches:
+        save(due, {name: removed}, now)
+    queued, count = len(messages), len(reminder_list)
+    if finished:
+        logging.info("Queued %d messages for %d reminders." %
+                     (queued, count))
+    else:
+        logging.info("Queued %d messages for %d reminders, "
+                     "out of time." % (queued, count))
+    return queued, count, finished
+
+
+def collect_batches(now, deadline):
+    """
+    Read the due buckets in batches of BATCH_SIZE keys until the
+    deadline. Returns a list of (bucket name, due reminders, keys to
+    remove) tuples, and whether all due buckets were read.
+    """
+    batches = []
+    for bucket in buckets.due_buckets(now):
+        name = bucket.key().name()
+        keys = bucket.reminders
+        for start in range(0, len(keys), BATCH_SIZE):
+            if time.time() >= deadline:
+                return batches, False
+            due, removed = collect(name, keys[start:start + BATCH_SIZE], now)
+            batches.append((name, due, removed))
+    return batches, True
+
+
+def collect(name, keys, now):
+    """
+    Get one batch of reminders from a bucket. Returns the list of due
+    reminders, and the list of keys to remove from the bucket (due
+    and stale). Reminders that are due later in the current hour stay
+    in the bucket.
+    """
+    due = []
+    removed = []
+    for key, reminder in zip(keys, db.get(keys)):
+        if (reminder is None or reminder.next is None
+            or buckets.bucket_name(reminder.next) != name
+            or not Reminder.owner.get_value_for_datastore(reminder)):
+            removed.append(key) # Deleted, rescheduled, or suggestion.
+        elif reminder.next <= now:
+            removed.append(key)
+            due.append(reminder)
+    return due, removed
+
+
+def get_owners(reminder_list):
+    """
+    Get the owner of each reminder, with one datastore call per batch.
+    """
+    keys = [Reminder.owner.get_value_for_datastore(reminder)
+            for reminder in reminder_list]
+    owner_list = []
+    for start in range(0, len(keys), BATCH_SIZE):
+        owner_list.extend(db.get(keys[start:start + BATCH_SIZE]))
+    return owner_list
+
+
+def single_messages(reminder_list, owner_list):
+    messages = []
+    for reminder, owner in zip(reminder_list, owner_list):
+        if owner is None or not owner.email:
+            continue
+        body = render_to_string('dispatch/reminder.txt', locals())
+        messages.append(mail.EmailMessage(
+                "Reminder: %s" % reminder.title, body,
+                settings.DEFAULT_FROM_EMAIL, [owner.email]))
+    return messages
+
+
+def digest_messages(reminder_list, owner_list):
+    """
+    Group due reminders by owner, and render one message per owner.
+    """
+    groups = {}
+    owners = []
+    for reminder, owner in zip(reminder_list, owner_list):
+        if owner is None or not owner.email:
+            continue
+        key = owner.key()
+        if key not in groups:
+            groups[key] = []
+            owners.append(owner)
+        groups[key].append(reminder)
+    messages = []
+    for owner in owners:
+        reminder_list = groups[owner.key()]
+        if len(reminder_list) == 1:
+            subject = "Reminder: %s" % reminder_list[0].title
+        else:
+            subject = "%d reminders" % len(reminder_list)
+        body = render_to_string('dispatch/digest.txt', locals())
+        messages.append(mail.EmailMessage(
+                subject, body, settings.DEFAULT_FROM_EMAIL, [owner.email]))
+    return messages
+
+
+def save(reminder_list, removals, now):
+    """
+    Advance all sent reminders to their next occurrence, save them in
+    batches, and move their keys to the new buckets.
+    """
+    advance_all(reminder_list, now)
+    for start in range(0, len(reminder_list), BATCH_SIZE):
+        db.put(reminder_list[start:start + BATCH_SIZE])
+    cache.invalidate_reminders(reminder_list)
+    additions = {}
+    for reminder in reminder_list:
+        if reminder.next is not None:
+            additions.setdefault(buckets.bucket_name(reminder.next),
+                                 []).append(reminder.key())
+    buckets.apply(additions, removals)
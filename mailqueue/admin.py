@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from mailqueue.models import OutgoingMail
+
+
+class OutgoingMailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'due', 'created')
+    search_fields = ('subject', )
+
+
+admin.site.register(OutgoingMail, OutgoingMailAdmin)
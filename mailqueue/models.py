@@ -0,0 +1,32 @@
+from google.appengine.ext import db
+
+
+class OutgoingMail(db.Model):
+    """
+    One message in the outbound mail queue. The worker sends it when
+    it is due, and retries with exponential backoff if sending fails.
+    After too many attempts, the status changes to dead and the
+    message stays in the datastore for inspection.
+    """
+    sender = db.StringProperty(required=True)
+    to = db.StringListProperty()
+    subject = db.StringProperty(required=True)
+    body = db.TextProperty()
+    status = db.StringProperty(default='queued',
+                               choices=('queued', 'dead'))
+    attempts = db.IntegerProperty(default=0)
+    error = db.TextProperty()
+    due = db.DateTimeProperty(auto_now_add=True)
+    created = db.DateTimeProperty(auto_now_add=True)
+
+    def __unicode__(self):
+        return self.subject
+
+
+class RateLimit(db.Model):
+    """
+    Token bucket for outbound mail: tokens refill at a fixed rate up
+    to a maximum, and each sent message takes one token.
+    """
+    tokens = db.FloatProperty(default=0.0)
+    updated = db.DateTimeProperty()
@@ -0,0 +1,151 @@
+"""
+Durable outbound mail queue.
+
+Request handlers only call enqueue() or enqueue_messages(), which
+store the messages in the datastore. The cron worker in views.py
+calls send_due() to send them in batches over one mail connection,
+limited by a token bucket.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from google.appengine.ext import db
+
+from django.conf import settings
+from django.core import mail
+
+from mailqueue.models import OutgoingMail, RateLimit
+
+BATCH_SIZE = 20
+RATE = 1.0 # Tokens per second.
+CAPACITY = 60.0 # Maximum burst size.
+MAX_ATTEMPTS = 6
+RETRY_DELAY = 60 # Seconds before the first retry, doubles each time.
+RATE_LIMIT_KEY_NAME = 'mail'
+
+
+def enqueue(subject, body, recipient_list, sender=None):
+    """
+    Queue a single message, same arguments as send_mail.
+    """
+    message = mail.EmailMessage(subject, body,
+                                sender or settings.DEFAULT_FROM_EMAIL,
+                                recipient_list)
+    return enqueue_messages([message])[0]
+
+
+def enqueue_messages(messages):
+    """
+    Queue a list of EmailMessage objects with a single datastore put.
+    """
+    queued = [OutgoingMail(sender=message.from_email or
+                                  settings.DEFAULT_FROM_EMAIL,
+                           to=list(message.to),
+                           subject=message.subject,
+                           body=message.body)
+              for message in messages]
+    if queued:
+        db.put(queued)
+    return queued
+
+
+def take_tokens(wanted, now):
+    """
+    Refill the token bucket and take up to the wanted number of whole
+    tokens. Returns the number of tokens taken.
+    """
+    def txn():
+        bucket = RateLimit.get_by_key_name(RATE_LIMIT_KEY_NAME)
+        if bucket is None:
+            bucket = RateLimit(key_name=RATE_LIMIT_KEY_NAME,
+                               tokens=CAPACITY)
+        elif bucket.updated:
+            elapsed = now - bucket.updated
+            seconds = elapsed.days * 86400 + elapsed.seconds
+            bucket.tokens = min(CAPACITY, bucket.tokens + seconds * RATE)
+        taken = min(wanted, int(bucket.tokens))
+        bucket.tokens -= taken
+        bucket.updated = now
+        bucket.put()
+        return taken
+    return db.run_in_transaction(txn)
+
+
+def give_back_tokens(count):
+    """
+    Return unused tokens, e.g. if fewer messages were due.
+    """
+    def txn():
+        bucket = RateLimit.get_by_key_name(RATE_LIMIT_KEY_NAME)
+        bucket.tokens = min(CAPACITY, bucket.tokens + count)
+        bucket.put()
+    if count:
+        db.run_in_transaction(txn)
+
+
+def send_due(now=None, connection=None):
+    """
+    Send one batch of due messages over one connection. Returns the
+    number of sent, retried and dead messages, or None if the rate
+    limit or the queue are exhausted.
+    """
+    if now is None:
+        now = datetime.now()
+    tokens = take_tokens(BATCH_SIZE, now)
+    if not tokens:
+        return None
+    queued = (OutgoingMail.all().filter('status', 'queued')
+              .filter('due <=', now).order('due').fetch(tokens))
+    give_back_tokens(tokens - len(queued))
+    if not queued:
+        return None
+    if connection is None:
+        connection = mail.SMTPConnection()
+    sent = []
+    failed = []
+    try:
+        if hasattr(connection, 'open'):
+            connection.open() # Keep it open for the whole batch.
+    except Exception, error:
+        # Nothing was sent, so keep the tokens and retry the batch.
+        logging.warning("Failed to open mail connection: %s" % error)
+        give_back_tokens(len(queued))
+        for item in queued:
+            fail(item, error, now)
+        db.put(queued)
+        dead = len([item for item in queued if item.status == 'dead'])
+        return 0, len(queued) - dead, dead
+    for item in queued:
+        message = mail.EmailMessage(item.subject, item.body,
+                                    item.sender, item.to,
+                                    connection=connection)
+        try:
+            message.send()
+            sent.append(item)
+        except Exception, error:
+            logging.warning("Failed to send mail %s to %s: %s" %
+                            (item.key(), item.to, error))
+            fail(item, error, now)
+            failed.append(item)
+    if hasattr(connection, 'close'):
+        connection.close()
+    if sent:
+        db.delete(sent)
+    if failed:
+        db.put(failed)
+    dead = len([item for item in failed if item.status == 'dead'])
+    return len(sent), len(failed) - dead, dead
+
+
+def fail(item, error, now):
+    """
+    Count a failed attempt, and schedule a retry with exponential
+    backoff, or give up after MAX_ATTEMPTS.
+    """
+    item.attempts += 1
+    item.error = unicode(error)
+    if item.attempts >= MAX_ATTEMPTS:
+        item.status = 'dead'
+    else:
+        delay = RETRY_DELAY * 2 ** (item.attempts - 1)
+        item.due = now + timedelta(seconds=delay)
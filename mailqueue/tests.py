@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+from django.core import mail
+from django.test import TestCase
+
+from mailqueue import outbox
+from mailqueue.models import OutgoingMail, RateLimit
+
+
+class FailingConnection(object):
+    """
+    Local stand-in for an SMTP server that is down.
+    """
+
+    def send_messages(self, messages):
+        raise IOError("Connection refused")
+
+
+class UnreachableConnection(object):
+    """
+    Local stand-in for an SMTP server that refuses connections.
+    """
+
+    def open(self):
+        raise IOError("Connection refused")
+
+
+class AnonymousTest(TestCase):
+
+    def test_anonymous(self):
+        response = self.client.get('/mailqueue/')
+        self.assertRedirects(response, '/accounts/login/?next=/mailqueue/')
+
+
+class QueueTest(TestCase):
+
+    def test_enqueue(self):
+        outbox.enqueue("Subject", "Body", ['a@example.com'])
+        self.assertEqual(OutgoingMail.all().count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        response = self.client.get('/mailqueue/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertTrue("Sent 1, retry 0, dead 0." in response.content)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['a@example.com'])
+        self.assertEqual(OutgoingMail.all().count(), 0)
+
+    def test_retry(self):
+        item = outbox.enqueue("Subject", "Body", ['a@example.com'])
+        now = datetime.now()
+        self.assertEqual(outbox.send_due(now, FailingConnection()),
+                         (0, 1, 0))
+        item = OutgoingMail.get(item.key())
+        self.assertEqual(item.attempts, 1)
+        self.assertEqual(item.due, now + timedelta(seconds=60))
+        self.assertTrue("Connection refused" in item.error)
+        # Not due yet, so nothing to send.
+        self.assertEqual(outbox.send_due(now), None)
+        later = now + timedelta(seconds=61)
+        self.assertEqual(outbox.send_due(later), (1, 0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_dead(self):
+        item = outbox.enqueue("Subject", "Body", ['a@example.com'])
+        now = datetime.now()
+        for attempt in range(outbox.MAX_ATTEMPTS):
+            now += timedelta(days=1)
+            outbox.send_due(now, FailingConnection())
+        item = OutgoingMail.get(item.key())
+        self.assertEqual(item.status, 'dead')
+        self.assertEqual(item.attempts, outbox.MAX_ATTEMPTS)
+        self.assertEqual(outbox.send_due(now + timedelta(days=1)), None)
+
+    def test_rate_limit(self):
+        for index in range(5):
+            outbox.enqueue("Subject %d" % index, "Body", ['a@example.com'])
+        now = datetime.now()
+        RateLimit(key_name=outbox.RATE_LIMIT_KEY_NAME,
+                  tokens=2.0, updated=now).put()
+        self.assertEqual(outbox.send_due(now), (2, 0, 0))
+        self.assertEqual(outbox.send_due(now), None)
+        self.assertEqual(outbox.send_due(now + timedelta(seconds=3)),
+                         (3, 0, 0))
+
+    def test_open_failure(self):
+        item = outbox.enqueue("Subject", "Body", ['a@example.com'])
+        now = datetime.now()
+        RateLimit(key_name=outbox.RATE_LIMIT_KEY_NAME,
+                  tokens=5.0, updated=now).put()
+        self.assertEqual(outbox.send_due(now, UnreachableConnection()),
+                         (0, 1, 0))
+        self.assertEqual(RateLimit.get_by_key_name(
+                outbox.RATE_LIMIT_KEY_NAME).tokens, 5.0)
+        item = OutgoingMail.get(item.key())
+        self.assertEqual(item.attempts, 1)
+        self.assertEqual(item.due, now + timedelta(seconds=60))
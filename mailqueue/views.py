@@ -0,0 +1,38 @@
+import logging
+import time
+
+from django.http import HttpResponse
+
+from utils.cron import cron_or_staff, TIME_BUDGET
+from mailqueue import outbox
+
+
+
+@cron_or_staff
+def index(request):
+    """
+    Drain the outbound mail queue, called by cron.
+    """
+    sent, retried, dead = drain(time.time() + TIME_BUDGET)
+    message = "Sent %d, retry %d, dead %d." % (sent, retried, dead)
+    if dead:
+        logging.error(message)
+    return HttpResponse(message + '\n', mimetype="text/plain")
+
+
+def drain(deadline, connection=None):
+    """
+    Send batches until the queue is empty, the rate limit is reached,
+    the deadline has passed, or a whole batch failed.
+    """
+    sent = retried = dead = 0
+    while time.time() < deadline:
+        result = outbox.send_due(connection=connection)
+        if result is None:
+            break
+        sent += result[0]
+        retried += result[1]
+        dead += result[2]
+        if not result[0]:
+            break # The mail server is down, try again on the next run.
+    return sent, retried, dead
@@ -0,0 +1,61 @@
+"""
+Pages of upcoming occurrences with opaque cursors.
+
+A cursor encodes the date and reminder key of the last occurrence on
+the previous page. The next page restarts the lazy merge at that date
+and skips the occurrences up to and including that one, so paging
+forward never expands or sorts more than one page of occurrences.
+"""
+import base64
+from datetime import datetime
+
+from google.appengine.ext import db
+
+from reminders.occurrences import merge
+
+PAGE_SIZE = 20
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(when, key):
+    text = '%s.%06d.%s' % (when.strftime('%Y%m%d%H%M%S'),
+                           when.microsecond, key)
+    return base64.urlsafe_b64encode(text)
+
+
+def decode_cursor(cursor):
+    try:
+        text = base64.urlsafe_b64decode(str(cursor))
+        timestamp, microsecond, key = text.split('.', 2)
+        when = datetime.strptime(timestamp, '%Y%m%d%H%M%S')
+        return when.replace(microsecond=int(microsecond)), db.Key(key)
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+def get_page(reminder_list, start, cursor=None, page_size=PAGE_SIZE):
+    """
+    Returns a list of (when, reminder) tuples and the cursor for the
+    next page, or None if there are no more occurrences.
+
+    The reminders must be in key order, like the cached list from
+    reminders.cache.get_reminder_list(), so that occurrences on the
+    same date have a stable order: merge() breaks ties by position
+    in the list, and the cursor key marks where the last page ended.
+    """
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        start = after[0]
+    events = []
+    for when, reminder in merge(reminder_list, start):
+        if after and (when, reminder.key()) <= after:
+            continue
+        events.append((when, reminder))
+        if len(events) == page_size:
+            when, reminder = events[-1]
+            return events, encode_cursor(when, reminder.key())
+    return events, None
@@ -0,0 +1,94 @@
+"""
+Memcache entries derived from each user's reminders.
+
+Every code path that writes reminders must call invalidate() or
+invalidate_reminders() afterwards, so that no stale entries survive.
+"""
+from google.appengine.api import memcache
+from google.appengine.datastore import entity_pb
+from google.appengine.ext import db
+
+from reminders.models import Reminder
+
+FEED_ETAG = 'reminders-feed-etag:%s'
+REMINDER_LIST = 'reminders-list:%s'
+RECOMMENDATIONS = 'reminders-recommendations:%s'
+PREFIXES = (FEED_ETAG, REMINDER_LIST, RECOMMENDATIONS)
+HITS = 'reminders-list-hits'
+MISSES = 'reminders-list-misses'
+MAX_SIZE = 900000 # Bytes, below the memcache value limit.
+
+
+def owner_key(owner):
+    """
+    Accept a User, a Key, or an encoded key string.
+    """
+    if hasattr(owner, 'key') and callable(owner.key):
+        return owner.key()
+    if isinstance(owner, db.Key):
+        return owner
+    return db.Key(owner)
+
+
+def invalidate(owners):
+    """
+    Delete all cached entries for these owners. None is ignored, so
+    that suggestions don't need special handling.
+    """
+    keys = set([str(owner_key(owner)) for owner in owners if owner])
+    if keys:
+        memcache.delete_multi([prefix % key
+                               for key in keys for prefix in PREFIXES])
+
+
+def invalidate_reminders(reminder_list):
+    invalidate([Reminder.owner.get_value_for_datastore(reminder)
+                for reminder in reminder_list])
+
+
+def get_feed_etag(owner):
+    return memcache.get(FEED_ETAG % owner_key(owner))
+
+
+def set_feed_etag(owner, etag):
+    memcache.set(FEED_ETAG % owner_key(owner), etag)
+
+
+def get_reminder_list(owner):
+    """
+    All reminders of this owner in key order, from memcache if
+    possible. Cached as encoded protocol buffers, so that the entities
+    come back exactly as they were stored, in the same order.
+    """
+    key = REMINDER_LIST % owner_key(owner)
+    encoded = memcache.get(key)
+    if encoded is not None:
+        increment(HITS)
+        return [db.model_from_protobuf(entity_pb.EntityProto(data))
+                for data in encoded]
+    increment(MISSES)
+    reminder_list = list(Reminder.all().filter('owner', owner_key(owner))
+                         .order('__key__'))
+    encoded = [db.model_to_protobuf(reminder).Encode()
+               for reminder in reminder_list]
+    # Very long lists, e.g. after a big import, are not cached and
+    # come from the datastore on every call.
+    if sum([len(data) for data in encoded]) < MAX_SIZE:
+        try:
+            memcache.set(key, encoded)
+        except ValueError:
+            pass
+    return reminder_list
+
+
+def increment(counter):
+    if memcache.incr(counter) is None:
+        memcache.add(counter, 1)
+
+
+def get_stats():
+    """
+    Returns the number of hits and misses for the reminder list cache.
+    """
+    counters = memcache.get_multi([HITS, MISSES])
+    return counters.get(HITS, 0), counters.get(MISSES, 0)
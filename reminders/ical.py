@@ -0,0 +1,103 @@
+"""
+iCalendar feed of a user's reminders.
+"""
+import hmac
+import hashlib
+
+from django.conf import settings
+
+PRODID = '-//Minderbot//Reminders//EN'
+
+
+def feed_token(owner_key):
+    """
+    Secret token for the private feed URL, so that nobody can guess
+    the feed of another user.
+    """
+    return hmac.new(settings.SECRET_KEY, str(owner_key),
+                    hashlib.sha1).hexdigest()
+
+
+def feed_url(owner_key):
+    return '/reminders/feed/%s/%s.ics' % (owner_key, feed_token(owner_key))
+
+
+def feed_etag(reminder_list):
+    """
+    Strong ETag that changes whenever any reminder is changed, added
+    or removed.
+    """
+    state = sorted('%s %s' % (reminder.key(), reminder.modified)
+                   for reminder in reminder_list)
+    return '"%s"' % hashlib.md5('\n'.join(state)).hexdigest()
+
+
+def rrule(reminder):
+    """
+    iCalendar can repeat by one interval only, so pick the shortest
+    of the alternatives.
+    """
+    candidates = []
+    if reminder.days > 0:
+        if reminder.days % 7 == 0:
+            candidates.append((reminder.days, 'WEEKLY', reminder.days / 7))
+        else:
+            candidates.append((reminder.days, 'DAILY', reminder.days))
+    if reminder.months > 0:
+        candidates.append((reminder.months * 30, 'MONTHLY', reminder.months))
+    if reminder.years > 0:
+        candidates.append((reminder.years * 365, 'YEARLY', reminder.years))
+    if candidates:
+        days, freq, interval = min(candidates)
+        return 'FREQ=%s;INTERVAL=%d' % (freq, interval)
+
+
+def escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def fold(line):
+    """
+    Split long content lines into 75 octet chunks, continued with a
+    leading space.
+    """
+    line = line.encode('utf-8')
+    chunks = []
+    while len(line) > 75:
+        cut = 75
+        # Don't split multi-byte characters.
+        while cut and (ord(line[cut]) & 0xC0) == 0x80:
+            cut -= 1
+        chunks.append(line[:cut])
+        line = ' ' + line[cut:]
+    chunks.append(line)
+    return '\r\n'.join(chunks) + '\r\n'
+
+
+def generate(reminder_list):
+    """
+    Generate the feed one line at a time, so that the response can
+    be streamed.
+    """
+    yield fold(u'BEGIN:VCALENDAR')
+    yield fold(u'VERSION:2.0')
+    yield fold(u'PRODID:%s' % PRODID)
+    yield fold(u'X-WR-CALNAME:Minderbot')
+    for reminder in reminder_list:
+        if reminder.next is None:
+            continue
+        yield fold(u'BEGIN:VEVENT')
+        yield fold(u'UID:%s@minderbot.com' % reminder.key())
+        stamp = reminder.modified or reminder.created
+        yield fold(u'DTSTAMP:%s' % stamp.strftime('%Y%m%dT%H%M%SZ'))
+        yield fold(u'DTSTART;VALUE=DATE:%s' %
+                   reminder.next.strftime('%Y%m%d'))
+        yield fold(u'SUMMARY:%s' % escape(reminder.title))
+        rule = rrule(reminder)
+        if rule:
+            yield fold(u'RRULE:%s' % rule)
+        yield fold(u'URL:http://www.minderbot.com%s' %
+                   reminder.get_absolute_url())
+        yield fold(u'END:VEVENT')
+    yield fold(u'END:VCALENDAR')
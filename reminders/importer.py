@@ -0,0 +1,254 @@
+"""
+Bulk import of reminders from iCalendar or CSV files.
+
+The upload is stored in an ImportFile entity, and the cron worker
+calls run_job() to import it in the background. The parsers read the
+file line by line and yield one dict per recurring event.
+import_rows() saves the reminders in chunks with one datastore put
+per chunk, together with the job progress, so that a run that
+reaches its deadline resumes after the last saved chunk.
+"""
+import csv
+import logging
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from google.appengine.ext import db
+
+from reminders.models import Reminder, ImportJob, ImportFile
+from reminders.recurrence import next_occurrences, skip_past
+from reminders import cache
+from dispatch import buckets
+from tags.normalize import normalize_tags
+
+CHUNK_SIZE = 100
+MAX_UPLOAD_SIZE = 900000 # Bytes, the upload is stored in one entity.
+MAX_ERRORS = 20 # Row errors to show on the import page.
+TITLE_LENGTH = 100
+RRULE_FREQUENCIES = {
+    'DAILY': ('days', 1),
+    'WEEKLY': ('days', 7),
+    'MONTHLY': ('months', 1),
+    'YEARLY': ('years', 1),
+    }
+
+
+def unfold(lines):
+    """
+    Join iCalendar continuation lines, which start with whitespace.
+    """
+    current = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def unescape(text):
+    return (text.replace('\\n', '\n').replace('\\N', '\n')
+            .replace('\\,', ',').replace('\\;', ';')
+            .replace('\\\\', '\\'))
+
+
+def parse_date(text):
+    """
+    Parse 20100131, 20100131T093000 or 20100131T093000Z, and also
+    2010-01-31 from CSV files. Returns None if the format is unknown.
+    """
+    text = text.strip().rstrip('Z')
+    for format in ('%Y%m%dT%H%M%S', '%Y%m%d', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, format)
+        except ValueError:
+            pass
+
+
+def parse_rrule(rule):
+    """
+    Map an RRULE to a dict of days, months or years. Rules that
+    repeat by hours, minutes or seconds don't fit reminders and
+    return None. BYDAY and similar parts are ignored.
+    """
+    parts = dict(part.split('=', 1) for part in rule.split(';')
+                 if '=' in part)
+    if parts.get('FREQ') not in RRULE_FREQUENCIES:
+        return None
+    field, factor = RRULE_FREQUENCIES[parts['FREQ']]
+    try:
+        interval = int(parts.get('INTERVAL', '1'))
+    except ValueError:
+        return None
+    if interval < 1:
+        return None
+    return {field: interval * factor}
+
+
+def parse_ical(lines):
+    """
+    Yield one dict per VEVENT, or None for events that don't repeat
+    and can't be imported, so that the caller can count them.
+    """
+    event = None
+    for line in unfold(lines):
+        name, sep, value = line.decode('utf-8', 'replace').partition(':')
+        name = name.split(';')[0].upper()
+        if name == 'BEGIN' and value.strip().upper() == 'VEVENT':
+            event = {}
+        elif event is None:
+            continue
+        elif name == 'END' and value.strip().upper() == 'VEVENT':
+            if event.get('title') and event.get('interval'):
+                row = event['interval'].copy()
+                row['title'] = event['title']
+                row['tags'] = event.get('tags', [])
+                row['next'] = event.get('next')
+                yield row
+            else:
+                yield None
+            event = None
+        elif name == 'SUMMARY':
+            event['title'] = unescape(value).strip()
+        elif name == 'DTSTART':
+            event['next'] = parse_date(value)
+        elif name == 'RRULE':
+            event['interval'] = parse_rrule(value.upper())
+        elif name == 'CATEGORIES':
+            event['tags'] = [tag.strip().lower()
+                             for tag in unescape(value).split(',')
+                             if tag.strip()]
+
+
+def parse_csv(lines):
+    """
+    Yield one dict per CSV row. The first row must name the columns:
+    title, and any of days, months, years, tags, next. Rows that
+    can't be imported yield an error message instead.
+    """
+    reader = csv.DictReader(lines)
+    for record in reader:
+        title = (record.get('title') or '').decode('utf-8', 'replace')
+        row = {'title': title.strip(),
+               'tags': (record.get('tags') or '').decode(
+                    'utf-8', 'replace').lower().split(),
+               'next': parse_date(record.get('next') or '')}
+        try:
+            for field in ('days', 'months', 'years'):
+                if (record.get(field) or '').strip():
+                    row[field] = int(record[field])
+        except ValueError:
+            yield "Line %d: days, months and years must be numbers." % (
+                reader.line_num)
+            continue
+        if not row['title']:
+            yield "Line %d: the title is missing." % reader.line_num
+        elif min(row.get('days', 0), row.get('months', 0),
+                 row.get('years', 0)) < 0:
+            yield "Line %d: the interval can't be negative." % (
+                reader.line_num)
+        elif not (row.get('days') or row.get('months') or
+                  row.get('years')):
+            yield "Line %d: the interval is missing." % reader.line_num
+        else:
+            yield row
+
+
+def parse(filename, lines):
+    if filename.lower().endswith('.csv'):
+        return parse_csv(lines)
+    return parse_ical(lines)
+
+
+def run_job(job, deadline, now=None):
+    """
+    Continue an import from the saved position until it is finished
+    or the deadline is reached. Returns True if it is finished.
+    """
+    upload = ImportFile.get_by_key_name('file', parent=job)
+    if upload is None:
+        # Not saved yet, or the upload request failed.
+        if job.created < (now or datetime.now()) - timedelta(hours=1):
+            job.status = 'failed'
+            job.put()
+            return True
+        return False
+    rows = islice(parse(job.filename, upload.data.splitlines(True)),
+                  job.position, None)
+    try:
+        finished = import_rows(rows, job, now, deadline)
+    except Exception:
+        # Keep going with the other imports in this cron run.
+        logging.exception("Import %s failed." % job.key().id())
+        job.status = 'failed'
+        job.put()
+        return True
+    if finished:
+        upload.delete()
+    return finished
+
+
+def import_rows(rows, job, now=None, deadline=None):
+    """
+    Create reminders from parsed rows in chunks of CHUNK_SIZE, with
+    one datastore put per chunk. The job counters and position are
+    saved with each chunk. Returns False if the deadline was reached
+    before the last row.
+    """
+    if now is None:
+        now = datetime.now()
+    owner = ImportJob.owner.get_value_for_datastore(job)
+    chunk = []
+    parsed = 0
+    for row in rows:
+        parsed += 1
+        if row is None or isinstance(row, basestring):
+            job.skipped += 1
+            if row and len(job.errors) < MAX_ERRORS:
+                job.errors.append(row)
+            continue
+        chunk.append(Reminder(
+                owner=owner,
+                title=row['title'][:TITLE_LENGTH],
+                tags=normalize_tags(row['tags']),
+                days=row.get('days'),
+                months=row.get('months'),
+                years=row.get('years'),
+                next=row['next'],
+                start=row['next']))
+        if len(chunk) == CHUNK_SIZE:
+            save_chunk(chunk, job, now, parsed)
+            chunk = []
+            parsed = 0
+            if deadline is not None and time.time() >= deadline:
+                cache.invalidate([owner])
+                return False
+    job.status = 'done'
+    save_chunk(chunk, job, now, parsed)
+    cache.invalidate([owner])
+    return True
+
+
+def save_chunk(reminder_list, job, now, parsed):
+    """
+    Schedule and save one chunk of new reminders, and record progress
+    in the same batch put.
+    """
+    # Events without a start date begin one interval from now.
+    unscheduled = [reminder for reminder in reminder_list
+                   if reminder.next is None]
+    for reminder, when in zip(unscheduled,
+                              next_occurrences(unscheduled, now)):
+        reminder.next = when
+    skip_past(reminder_list, now)
+    job.imported += len(reminder_list)
+    job.position += parsed
+    db.put(reminder_list + [job])
+    if reminder_list:
+        buckets.update([(reminder.key(), None, reminder.next)
+                        for reminder in reminder_list])
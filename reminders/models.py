@@ -25,7 +25,12 @@ class Reminder(db.Model):
     kilometers = db.IntegerProperty()
     previous = db.DateTimeProperty()
     next = db.DateTimeProperty()
+    # Start of the schedule, like DTSTART in iCalendar. Occurrences
+    # are counted from it, so that monthly reminders don't drift.
+    start = db.DateTimeProperty()
     created = db.DateTimeProperty(auto_now_add=True)
+    modified = db.DateTimeProperty(auto_now=True)
+    source = db.StringProperty() # Key name of the suggestion, if any.
 
     def __unicode__(self):
         return self.title
@@ -61,3 +66,34 @@ class Reminder(db.Model):
         if self.kilometers > 1:
             parts.append('%d kilometers' % self.kilometers)
         return ' or '.join(parts)
+
+
+class ImportJob(db.Model):
+    """
+    Progress of a bulk import from an uploaded iCalendar or CSV file.
+    The counters and the number of parsed rows (position) are saved
+    after each chunk, so that the cron worker can resume, and the
+    status page can show progress for large files.
+    """
+    owner = db.ReferenceProperty(User, required=True)
+    filename = db.StringProperty()
+    position = db.IntegerProperty(default=0)
+    errors = db.StringListProperty(indexed=False)
+    status = db.StringProperty(default='running',
+                               choices=('running', 'done', 'failed'))
+    imported = db.IntegerProperty(default=0)
+    skipped = db.IntegerProperty(default=0)
+    created = db.DateTimeProperty(auto_now_add=True)
+    updated = db.DateTimeProperty(auto_now=True)
+
+    def __unicode__(self):
+        return self.filename or unicode(self.key().id())
+
+
+class ImportFile(db.Model):
+    """
+    The uploaded file of an ImportJob, kept until it is imported. The
+    parent is the job, and the key name is always 'file', so that the
+    job can be saved after each chunk without rewriting the file.
+    """
+    data = db.BlobProperty()
@@ -0,0 +1,67 @@
+"""
+Lazy streams of reminder occurrences.
+
+Each reminder expands into a generator of its occurrence dates, and
+merge() combines many of them in date order with a heap that holds
+only the next occurrence of each reminder. Taking the next k events
+across n reminders costs O(k log n), no schedule is ever expanded
+further than needed.
+"""
+import heapq
+from itertools import islice
+
+from reminders.recurrence import add_interval, occurrences_after
+
+
+def expand(reminder, start):
+    """
+    Generate the occurrences of one reminder at or after start,
+    beginning with its scheduled next occurrence. Later occurrences
+    are counted from the start of its schedule. Reminders that don't
+    repeat by time yield at most one occurrence.
+    """
+    when = reminder.next
+    if when is None:
+        when = add_interval(reminder, reminder.previous or start)
+    anchor = reminder.start or when
+    while when is not None:
+        if when >= start:
+            yield when
+        when = occurrences_after([reminder], [anchor], [when])[0]
+
+
+def merge(reminder_list, start, end=None):
+    """
+    Generate (when, reminder) tuples for all reminders in date order,
+    from start up to but not including end (or forever).
+    """
+    heap = []
+    for index, reminder in enumerate(reminder_list):
+        stream = expand(reminder, start)
+        for when in stream:
+            heap.append((when, index, stream))
+            break
+    heapq.heapify(heap)
+    while heap:
+        when, index, stream = heap[0]
+        if end is not None and when >= end:
+            return
+        yield when, reminder_list[index]
+        try:
+            heapq.heapreplace(heap, (stream.next(), index, stream))
+        except StopIteration:
+            heapq.heappop(heap)
+
+
+def upcoming(reminder_list, start, count):
+    """
+    The next count occurrences across all reminders.
+    """
+    return list(islice(merge(reminder_list, start), count))
+
+
+def window(reminder_list, start, end):
+    """
+    All occurrences from start up to but not including end.
+    """
+    return list(merge(reminder_list, start, end))
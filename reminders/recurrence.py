@@ -0,0 +1,218 @@
+"""
+Calendar arithmetic for reminder intervals.
+
+All functions work on whole batches of reminders at once: the dates
+and interval fields are unpacked into integer arrays (proleptic
+Gregorian day ordinals, like date.toordinal), each alternative
+interval is computed column by column, and the earliest alternative
+wins, like the "or" in Reminder.interval(). Repeated occurrences are
+counted in whole periods from the start of the schedule, not from
+the previous occurrence, so that clamped month ends don't drift.
+"""
+from array import array
+from datetime import timedelta
+
+DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+DAYS_BEFORE_MONTH = (0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+
+
+def is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def to_ordinal(year, month, day):
+    """
+    Same result as date(year, month, day).toordinal().
+    """
+    y = year - 1
+    ordinal = (y * 365 + y // 4 - y // 100 + y // 400 +
+               DAYS_BEFORE_MONTH[month] + day)
+    if month > 2 and is_leap(year):
+        ordinal += 1
+    return ordinal
+
+
+def shift_months(years, months, days, offsets):
+    """
+    Add offsets[i] months to each date given as separate year, month
+    and day arrays. Offsets can also be zero or negative. Returns an
+    array of ordinals, clamped to the last day of the month (Jan 31 +
+    1 month = Feb 28 or Feb 29).
+    """
+    result = array('l', [0]) * len(offsets)
+    for index, offset in enumerate(offsets):
+        year, month = divmod(years[index] * 12 + months[index] - 1 + offset,
+                             12)
+        month += 1
+        last = DAYS_IN_MONTH[month]
+        if month == 2 and is_leap(year):
+            last = 29
+        result[index] = to_ordinal(year, month, min(days[index], last))
+    return result
+
+
+def get_periods(reminder_list, anchor_list):
+    """
+    The period of each reminder as a (days, months) pair where one of
+    them is zero: the alternative interval that ends first when
+    counted from the anchor, like the "or" in Reminder.interval().
+    Calendar months win ties. The period is None for reminders that
+    don't repeat by time (only by distance).
+    """
+    days = array('l', [reminder.days or 0 for reminder in reminder_list])
+    months = array('l', [reminder.months or 0 for reminder in reminder_list])
+    years = array('l', [12 * (reminder.years or 0)
+                        for reminder in reminder_list])
+    ordinals = array('l', [anchor.toordinal() for anchor in anchor_list])
+    anchor_years = array('l', [anchor.year for anchor in anchor_list])
+    anchor_months = array('l', [anchor.month for anchor in anchor_list])
+    anchor_days = array('l', [anchor.day for anchor in anchor_list])
+    by_months = shift_months(anchor_years, anchor_months, anchor_days, months)
+    by_years = shift_months(anchor_years, anchor_months, anchor_days, years)
+    periods = []
+    for index in range(len(reminder_list)):
+        candidates = []
+        if days[index] > 0:
+            candidates.append((ordinals[index] + days[index], days[index], 0))
+        if months[index] > 0:
+            candidates.append((by_months[index], 0, months[index]))
+        if years[index] > 0:
+            candidates.append((by_years[index], 0, years[index]))
+        if candidates:
+            periods.append(min(candidates)[1:])
+        else:
+            periods.append(None)
+    return periods
+
+
+def add_periods(anchor_list, periods, counts):
+    """
+    Add counts[i] whole periods to each anchor, keeping the time of
+    day. Months are always counted from the day of the anchor, so Jan
+    31 + 2 months is Mar 31, not Feb 28 + 1 month. The result is None
+    where the period is None.
+    """
+    offsets = array('l', [period and period[1] * count or 0
+                          for period, count in zip(periods, counts)])
+    by_months = shift_months(
+        array('l', [anchor.year for anchor in anchor_list]),
+        array('l', [anchor.month for anchor in anchor_list]),
+        array('l', [anchor.day for anchor in anchor_list]), offsets)
+    result = []
+    for index, anchor in enumerate(anchor_list):
+        period = periods[index]
+        if period is None:
+            result.append(None)
+        elif period[0]:
+            result.append(anchor + timedelta(days=period[0] * counts[index]))
+        else:
+            result.append(anchor + timedelta(
+                    days=by_months[index] - anchor.toordinal()))
+    return result
+
+
+def add_intervals(reminder_list, start_list):
+    """
+    For each reminder, add the shortest of its alternative intervals
+    to the corresponding start datetime, keeping the time of day. The
+    result is None for reminders that don't repeat by time (only by
+    distance).
+    """
+    return add_periods(start_list, get_periods(reminder_list, start_list),
+                       [1] * len(start_list))
+
+
+def add_interval(reminder, when):
+    return add_intervals([reminder], [when])[0]
+
+
+def add_months(when, months):
+    """
+    Add a number of months to a single datetime, clamping to the last
+    day of the month. Zero months is the same datetime, and negative
+    numbers count backwards.
+    """
+    ordinal = shift_months([when.year], [when.month], [when.day],
+                           [months])[0]
+    return when + timedelta(days=ordinal - when.toordinal())
+
+
+def occurrences_after(reminder_list, anchor_list, after_list):
+    """
+    For each reminder, the first occurrence after the corresponding
+    datetime, on the schedule that starts at the anchor, or the
+    anchor itself if it is later. The number of periods is computed
+    directly, so a daily reminder that is years behind costs the
+    same as one that is on time.
+    """
+    periods = get_periods(reminder_list, anchor_list)
+    counts = []
+    for anchor, after, period in zip(anchor_list, after_list, periods):
+        if period is None:
+            counts.append(0)
+        elif period[0]:
+            elapsed = after - anchor
+            seconds = elapsed.days * 86400 + elapsed.seconds
+            counts.append(max(0, seconds // (period[0] * 86400) + 1))
+        else:
+            elapsed = ((after.year - anchor.year) * 12 +
+                       after.month - anchor.month)
+            counts.append(max(0, elapsed // period[1]))
+    result = add_periods(anchor_list, periods, counts)
+    # Monthly counts can be one short, in the same month as after.
+    late = [index for index, when in enumerate(result)
+            if when is not None and when <= after_list[index]]
+    if late:
+        later = add_periods([anchor_list[index] for index in late],
+                            [periods[index] for index in late],
+                            [counts[index] + 1 for index in late])
+        for index, when in zip(late, later):
+            result[index] = when
+    return result
+
+
+def next_occurrences(reminder_list, now):
+    """
+    The next occurrence of each reminder after the previous one, or
+    one full interval from now if it was never sent. Use this to
+    recompute many schedules at once, e.g. after a bulk import.
+    """
+    return add_intervals(reminder_list,
+                         [reminder.previous or now
+                          for reminder in reminder_list])
+
+
+def first_occurrence(reminder, now):
+    return next_occurrences([reminder], now)[0]
+
+
+def advance_all(reminder_list, now):
+    """
+    Mark the current occurrence of each reminder as sent, and
+    schedule the first occurrence after now.
+    """
+    for reminder in reminder_list:
+        reminder.previous = reminder.next
+    skip_past(reminder_list, now)
+
+
+def skip_past(reminder_list, now):
+    """
+    Move the next occurrence of each reminder that is due to the
+    first one after now, in one pass. Reminders without a start get
+    their current next occurrence as the start of their schedule.
+    """
+    pending = [reminder for reminder in reminder_list
+               if reminder.next is not None and reminder.next <= now]
+    for reminder in pending:
+        if reminder.start is None:
+            reminder.start = reminder.next
+    next_list = occurrences_after(pending,
+                                  [reminder.start for reminder in pending],
+                                  [now] * len(pending))
+    for reminder, when in zip(pending, next_list):
+        reminder.next = when
+
+
+def advance(reminder, now):
+    advance_all([reminder], now)
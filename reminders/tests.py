@@ -1,10 +1,19 @@
 from datetime import datetime, timedelta
+from StringIO import StringIO
+
+from google.appengine.api import memcache
 
 from django.test import TestCase
+from django.utils import simplejson
 from django.contrib.auth.models import User
 
 from tags.models import Tag
-from reminders.models import Reminder
+from reminders.models import Reminder, ImportJob, ImportFile
+from reminders.recurrence import add_months, next_occurrences, advance
+from reminders.recurrence import skip_past
+from reminders.occurrences import upcoming, window
+from reminders import agenda, cache, ical, importer
+from suggestions import recommend, catalog, version
 
 
 class AnonymousTest(TestCase):
@@ -53,3 +62,404 @@ class IntervalTest(TestCase):
                          'week or month')
         self.assertEqual(Reminder(miles=1000, kilometers=1600).interval(),
                          '100 miles or 160 kilometers')
+
+
+class RecurrenceTest(TestCase):
+
+    def test_add_months(self):
+        self.assertEqual(add_months(datetime(2010, 1, 31), 1),
+                         datetime(2010, 2, 28))
+        self.assertEqual(add_months(datetime(2012, 1, 31), 1),
+                         datetime(2012, 2, 29))
+        self.assertEqual(add_months(datetime(2009, 11, 15), 3),
+                         datetime(2010, 2, 15))
+        self.assertEqual(add_months(datetime(2009, 11, 15), 24),
+                         datetime(2011, 11, 15))
+        self.assertEqual(add_months(datetime(2010, 1, 31), 0),
+                         datetime(2010, 1, 31))
+        self.assertEqual(add_months(datetime(2010, 3, 31), -1),
+                         datetime(2010, 2, 28))
+        self.assertEqual(add_months(datetime(2010, 1, 15), -13),
+                         datetime(2008, 12, 15))
+
+    def test_next_occurrences(self):
+        previous = datetime(2010, 1, 31, 9, 30)
+        now = datetime(2010, 2, 1)
+        reminder_list = [
+            Reminder(title='a', days=30, months=1, previous=previous),
+            Reminder(title='b', months=1, years=1, previous=previous),
+            Reminder(title='c', years=1),
+            Reminder(title='d', miles=3000)]
+        self.assertEqual(next_occurrences(reminder_list, now), [
+                datetime(2010, 2, 28, 9, 30),
+                datetime(2010, 2, 28, 9, 30),
+                datetime(2011, 2, 1),
+                None])
+
+    def test_advance(self):
+        reminder = Reminder(title='a', days=7, next=datetime(2009, 12, 1))
+        advance(reminder, datetime(2009, 12, 20))
+        self.assertEqual(reminder.previous, datetime(2009, 12, 1))
+        self.assertEqual(reminder.next, datetime(2009, 12, 22))
+
+    def test_month_ends(self):
+        reminder = Reminder(title='a', months=1, next=datetime(2010, 1, 31))
+        dates = []
+        for now in (datetime(2010, 1, 31), datetime(2010, 2, 28),
+                    datetime(2010, 3, 31)):
+            advance(reminder, now)
+            dates.append(reminder.next)
+        self.assertEqual(dates, [datetime(2010, 2, 28),
+                                 datetime(2010, 3, 31),
+                                 datetime(2010, 4, 30)])
+
+    def test_far_behind(self):
+        reminder = Reminder(title='a', days=1,
+                            next=datetime(2000, 1, 1, 9, 0))
+        skip_past([reminder], datetime(2010, 6, 1, 12, 0))
+        self.assertEqual(reminder.next, datetime(2010, 6, 2, 9, 0))
+        self.assertEqual(reminder.start, datetime(2000, 1, 1, 9, 0))
+
+
+class OccurrencesTest(TestCase):
+
+    def setUp(self):
+        self.weekly = Reminder(title='weekly', days=7,
+                               next=datetime(2010, 1, 4))
+        self.monthly = Reminder(title='monthly', months=1,
+                                next=datetime(2010, 1, 31))
+        self.distance = Reminder(title='distance', miles=3000)
+
+    def test_upcoming(self):
+        events = upcoming([self.weekly, self.monthly, self.distance],
+                          datetime(2010, 1, 1), 6)
+        self.assertEqual([(when.day, reminder.title)
+                          for when, reminder in events], [
+                (4, 'weekly'), (11, 'weekly'), (18, 'weekly'),
+                (25, 'weekly'), (31, 'monthly'), (1, 'weekly')])
+
+    def test_window(self):
+        events = window([self.weekly, self.monthly],
+                        datetime(2010, 2, 1), datetime(2010, 3, 1))
+        self.assertEqual([when for when, reminder in events], [
+                datetime(2010, 2, 1), datetime(2010, 2, 8),
+                datetime(2010, 2, 15), datetime(2010, 2, 22),
+                datetime(2010, 2, 28)])
+
+
+class AgendaTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'a@b.com', 'pass')
+        self.assertTrue(
+            self.client.login(username='a@b.com', password='pass'))
+        start = datetime.now() + timedelta(days=1)
+        for days in (1, 2, 3):
+            Reminder(title="Every %d days" % days, days=days, next=start,
+                     owner=self.user).put()
+
+    def test_paging(self):
+        reminder_list = cache.get_reminder_list(self.user)
+        start = datetime.now()
+        first, cursor = agenda.get_page(reminder_list, start, None, 4)
+        second, cursor = agenda.get_page(reminder_list, start, cursor, 4)
+        both, cursor = agenda.get_page(reminder_list, start, None, 8)
+        self.assertEqual([(when, reminder.key())
+                          for when, reminder in first + second],
+                         [(when, reminder.key())
+                          for when, reminder in both])
+        dates = [when for when, reminder in both]
+        self.assertEqual(dates, sorted(dates))
+
+    def test_invalid_cursor(self):
+        self.assertRaises(agenda.InvalidCursor, agenda.decode_cursor, 'x')
+        response = self.client.get('/reminders/agenda/json/?cursor=x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_agenda(self):
+        response = self.client.get('/reminders/agenda/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue("Every 3 days" in response.content)
+
+    def test_json(self):
+        response = self.client.get('/reminders/agenda/json/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = simplejson.loads(response.content)
+        self.assertEqual(len(data['events']), agenda.PAGE_SIZE)
+        self.assertEqual(data['events'][0]['title'], "Every 1 days")
+        response = self.client.get('/reminders/agenda/json/',
+                                   {'cursor': data['cursor']})
+        later = simplejson.loads(response.content)
+        self.assertTrue(later['events'][0]['date'] >=
+                        data['events'][-1]['date'])
+
+
+class FeedTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'a@b.com', 'pass')
+        self.reminder = Reminder(title="Pay rent; on time", months=1,
+                                 next=datetime(2010, 1, 1),
+                                 owner=self.user)
+        self.reminder.put()
+        self.url = ical.feed_url(self.user.key())
+
+    def test_wrong_token(self):
+        response = self.client.get(
+            '/reminders/feed/%s/0123abcd.ics' % self.user.key())
+        self.assertEqual(response.status_code, 404)
+
+    def test_feed(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/calendar'))
+        self.assertTrue('BEGIN:VCALENDAR\r\n' in response.content)
+        self.assertTrue('SUMMARY:Pay rent\\; on time' in response.content)
+        self.assertTrue('DTSTART;VALUE=DATE:20100101' in response.content)
+        self.assertTrue('RRULE:FREQ=MONTHLY;INTERVAL=1' in response.content)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Changes invalidate the ETag.
+        self.client.login(username='a@b.com', password='pass')
+        self.client.post(self.reminder.get_absolute_url(), {
+                'title': "Pay rent", 'tags': 'home', 'months': 1})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_rrule(self):
+        self.assertEqual(ical.rrule(Reminder(title='a', days=14)),
+                         'FREQ=WEEKLY;INTERVAL=2')
+        self.assertEqual(ical.rrule(Reminder(title='a', days=3)),
+                         'FREQ=DAILY;INTERVAL=3')
+        self.assertEqual(ical.rrule(Reminder(title='a', days=90, years=1)),
+                         'FREQ=DAILY;INTERVAL=90')
+        self.assertEqual(ical.rrule(Reminder(title='a', miles=3000)), None)
+
+    def test_fold(self):
+        line = ical.fold(u'SUMMARY:' + u'x' * 100)
+        self.assertEqual(line.split('\r\n')[1][0], ' ')
+        self.assertTrue(max(len(part) for part in line.split('\r\n')) <= 75)
+
+
+ICAL = """\
+BEGIN:VCALENDAR
+VERSION:2.0
+BEGIN:VEVENT
+SUMMARY:Replace smoke alarm batteries\\, all floors
+DTSTART;VALUE=DATE:20091001
+RRULE:FREQ=YEARLY
+CATEGORIES:Home,Safety
+END:VEVENT
+BEGIN:VEVENT
+SUMMARY:Water the
+  plants
+RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO
+END:VEVENT
+BEGIN:VEVENT
+SUMMARY:Dentist appointment
+DTSTART:20100215T100000Z
+END:VEVENT
+END:VCALENDAR
+"""
+
+CSV = """\
+title,days,months,years,tags,next
+Change oil,,3,,car,2010-03-01
+Check tire pressure,14,,,car safety,
+Broken row,x,,,,
+Never,0,0,0,,
+Backwards,-7,,,,
+"""
+
+
+class ImportTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'a@b.com', 'pass')
+
+    def test_parse_ical(self):
+        rows = list(importer.parse('calendar.ics', ICAL.splitlines(True)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['title'],
+                         "Replace smoke alarm batteries, all floors")
+        self.assertEqual(rows[0]['years'], 1)
+        self.assertEqual(rows[0]['tags'], ['home', 'safety'])
+        self.assertEqual(rows[0]['next'], datetime(2009, 10, 1))
+        self.assertEqual(rows[1]['title'], "Water the plants")
+        self.assertEqual(rows[1]['days'], 14)
+        self.assertEqual(rows[2], None) # Not recurring.
+
+    def test_parse_csv(self):
+        rows = list(importer.parse('reminders.csv', CSV.splitlines(True)))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['months'], 3)
+        self.assertEqual(rows[0]['next'], datetime(2010, 3, 1))
+        self.assertEqual(rows[1]['tags'], ['car', 'safety'])
+        self.assertEqual(rows[2],
+                         "Line 4: days, months and years must be numbers.")
+        self.assertEqual(rows[3], "Line 5: the interval is missing.")
+        self.assertEqual(rows[4], "Line 6: the interval can't be negative.")
+
+    def test_import_rows(self):
+        importer.CHUNK_SIZE = 1
+        job = ImportJob(owner=self.user, filename='calendar.ics')
+        job.put()
+        now = datetime(2010, 1, 1)
+        importer.import_rows(
+            importer.parse('calendar.ics', ICAL.splitlines(True)), job, now)
+        job = ImportJob.get(job.key())
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.imported, 2)
+        self.assertEqual(job.skipped, 1)
+        reminder_list = list(Reminder.all().filter('owner', self.user))
+        self.assertEqual(len(reminder_list), 2)
+        for reminder in reminder_list:
+            self.assertTrue(reminder.next > now)
+        importer.CHUNK_SIZE = 100
+
+    def test_upload(self):
+        self.assertTrue(
+            self.client.login(username='a@b.com', password='pass'))
+        upload = StringIO(CSV)
+        upload.name = 'reminders.csv'
+        response = self.client.post('/reminders/import/', {'file': upload})
+        self.assertRedirects(response, '/reminders/import/')
+        self.assertEqual(
+            Reminder.all().filter('owner', self.user).count(), 0)
+        response = self.client.get('/reminders/import/run/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Finished 1 imports." in response.content)
+        self.assertEqual(
+            Reminder.all().filter('owner', self.user).count(), 2)
+        job = ImportJob.all().get()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.skipped, 3)
+        self.assertEqual(len(job.errors), 3)
+        self.assertEqual(ImportFile.all().count(), 0)
+
+    def test_failed_job(self):
+        broken = ImportJob(owner=self.user, filename='broken.csv')
+        broken.put()
+        ImportFile(parent=broken, key_name='file',
+                   data='title,days\n\x00,1\n').put()
+        job = ImportJob(owner=self.user, filename='reminders.csv')
+        job.put()
+        ImportFile(parent=job, key_name='file', data=CSV).put()
+        response = self.client.get('/reminders/import/run/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Finished 2 imports." in response.content)
+        self.assertEqual(ImportJob.get(broken.key()).status, 'failed')
+        self.assertEqual(ImportJob.get(job.key()).status, 'done')
+
+    def test_resume(self):
+        job = ImportJob(owner=self.user, filename='calendar.ics')
+        job.put()
+        ImportFile(parent=job, key_name='file', data=ICAL).put()
+        now = datetime(2010, 1, 1)
+        importer.CHUNK_SIZE = 1
+        try:
+            # The deadline has passed after the first chunk.
+            self.assertFalse(importer.run_job(job, 0, now))
+            job = ImportJob.get(job.key())
+            self.assertEqual((job.position, job.imported), (1, 1))
+            self.assertTrue(importer.run_job(job, None, now))
+        finally:
+            importer.CHUNK_SIZE = 100
+        job = ImportJob.get(job.key())
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((job.imported, job.skipped), (2, 1))
+        self.assertEqual(
+            Reminder.all().filter('owner', self.user).count(), 2)
+
+
+class CacheTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'a@b.com', 'pass')
+        self.assertTrue(
+            self.client.login(username='a@b.com', password='pass'))
+        self.reminder = Reminder(title="Water plants", days=3,
+                                 owner=self.user)
+        self.reminder.put()
+        cache.invalidate([self.user])
+
+    def test_read_through(self):
+        hits, misses = cache.get_stats()
+        self.assertEqual(len(cache.get_reminder_list(self.user)), 1)
+        self.assertEqual(cache.get_stats(), (hits, misses + 1))
+        # Not from the datastore: this reminder isn't in the cache yet.
+        Reminder(title="Not cached", days=1, owner=self.user).put()
+        reminder_list = cache.get_reminder_list(self.user)
+        self.assertEqual(cache.get_stats(), (hits + 1, misses + 1))
+        self.assertEqual([reminder.title for reminder in reminder_list],
+                         ["Water plants"])
+        self.assertEqual(reminder_list[0].key(), self.reminder.key())
+
+    def test_too_big(self):
+        hits, misses = cache.get_stats()
+        cache.MAX_SIZE, max_size = 10, cache.MAX_SIZE
+        try:
+            cache.get_reminder_list(self.user)
+            self.assertEqual(len(cache.get_reminder_list(self.user)), 1)
+        finally:
+            cache.MAX_SIZE = max_size
+        self.assertEqual(cache.get_stats(), (hits, misses + 2))
+
+    def test_invalidate_on_save(self):
+        response = self.client.get('/reminders/')
+        self.assertTrue("Water plants" in response.content)
+        self.client.post(self.reminder.get_absolute_url(), {
+                'title': "Water all plants", 'tags': 'home', 'days': 3})
+        response = self.client.get('/reminders/')
+        self.assertTrue("Water all plants" in response.content)
+
+
+class RecommendTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+        for slug, title, tags in (
+            ('water-plants', "Water plants", ['garden', 'home']),
+            ('fertilize-lawn', "Fertilize lawn", ['garden', 'lawn']),
+            ('mow-lawn', "Mow lawn", ['lawn']),
+            ('pay-rent', "Pay rent", ['home', 'money']),
+            ('oil-change', "Change oil", ['car'])):
+            Reminder(key_name=slug, title=title, tags=tags, days=7).put()
+        self.user = User.objects.create_user('user', 'a@b.com', 'pass')
+        self.assertTrue(
+            self.client.login(username='a@b.com', password='pass'))
+
+    def test_recommend(self):
+        reminder_list = [
+            Reminder(owner=self.user, title="Water plants", days=3,
+                     tags=['garden']),
+            Reminder(owner=self.user, title="Mow the lawn", days=7,
+                     tags=['lawn'], source='mow-lawn')]
+        self.assertEqual(recommend.recommend(reminder_list),
+                         ['fertilize-lawn'])
+        reminder_list[0].tags.append('home')
+        self.assertEqual(recommend.recommend(reminder_list),
+                         ['fertilize-lawn', 'pay-rent'])
+        self.assertEqual(recommend.recommend([]), [])
+
+    def test_panel(self):
+        self.client.post('/suggestions/mow-lawn/')
+        response = self.client.get('/reminders/')
+        self.assertTrue('<a href="/suggestions/fertilize-lawn/">'
+                        in response.content)
+        self.assertFalse('<a href="/suggestions/mow-lawn/">'
+                         in response.content)
+        self.assertFalse('<a href="/suggestions/oil-change/">'
+                         in response.content)
+        # A new catalog snapshot replaces the cached recommendations.
+        Reminder(key_name='seed-lawn', title="Seed lawn", tags=['lawn'],
+                 days=30).put()
+        version.bump()
+        catalog.rebuild()
+        response = self.client.get('/reminders/')
+        self.assertTrue('<a href="/suggestions/seed-lawn/">'
+                        in response.content)
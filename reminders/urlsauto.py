@@ -2,5 +2,11 @@ from django.conf.urls.defaults import *
 
 urlpatterns = patterns('reminders.views',
     url(r'^$', 'index'),
+    url(r'^agenda/$', 'agenda'),
+    url(r'^agenda/json/$', 'agenda_json'),
+    url(r'^feed/(?P<owner_key>[\w-]+)/(?P<token>[0-9a-f]+)\.ics$', 'feed'),
+    url(r'^import/$', 'import_file'),
+    url(r'^import/run/$', 'run_imports'),
+    url(r'^import/(?P<job_id>\d+)/$', 'import_status'),
     url(r'^(?P<key_id>\d+)/$', 'detail'),
 )
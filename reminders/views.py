@@ -1,14 +1,30 @@
 import logging
+import time
+from datetime import datetime
+
+from google.appengine.ext import db
 
 from django import forms
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponseBadRequest, HttpResponseNotModified
+from django.http import Http404
+from django.utils import simplejson
 from django.contrib.auth.models import Message
 from django.contrib.auth.decorators import login_required
 
 from ragendja.template import render_to_response
 from ragendja.dbutils import get_object_or_404
 
-from reminders.models import Reminder
+from utils.cron import cron_or_staff, TIME_BUDGET
+from reminders.models import Reminder, ImportJob, ImportFile
+from reminders.recurrence import first_occurrence
+from reminders import agenda as agenda_pages
+from reminders import cache, ical, importer
+from dispatch import buckets
+from tags.normalize import normalize_tags
+from suggestions import recommend
+
+BATCH_SIZE = 10
 
 
 @login_required
@@ -16,15 +32,57 @@ def index(request):
     """
     List all reminders for a registered user.
     """
-    reminder_list = Reminder.all().filter('owner', request.user)
+    reminder_list = cache.get_reminder_list(request.user)
+    recommendation_list = recommend.get_recommendations(
+        request.user, reminder_list)
+    feed_url = ical.feed_url(request.user.key())
     return render_to_response(request, 'reminders/index.html', locals())
 
 
+@login_required
+def agenda(request):
+    """
+    Upcoming occurrences of all reminders for a registered user,
+    in date order.
+    """
+    try:
+        event_list, cursor = agenda_pages.get_page(
+            cache.get_reminder_list(request.user),
+            datetime.now(), request.GET.get('cursor'))
+    except agenda_pages.InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor.")
+    return render_to_response(request, 'reminders/agenda.html', locals())
+
+
+@login_required
+def agenda_json(request):
+    """
+    Same as agenda, for scrolling with JavaScript.
+    """
+    try:
+        event_list, cursor = agenda_pages.get_page(
+            cache.get_reminder_list(request.user),
+            datetime.now(), request.GET.get('cursor'))
+    except agenda_pages.InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor.")
+    data = {
+        'events': [{'date': when.strftime('%Y-%m-%d'),
+                    'title': reminder.title,
+                    'interval': reminder.interval(),
+                    'url': reminder.get_absolute_url()}
+                   for when, reminder in event_list],
+        'cursor': cursor,
+        }
+    return HttpResponse(simplejson.dumps(data),
+                        mimetype='application/json')
+
+
 class ReminderForm(forms.ModelForm):
     title = forms.CharField(max_length=100,
         widget=forms.TextInput(attrs={'class': 'h1 text span-17'}))
     tags = forms.CharField(max_length=200,
-        widget=forms.TextInput(attrs={'class': 'text span-10'}))
+        widget=forms.TextInput(
+            attrs={'class': 'text span-10 autocomplete'}))
     days = forms.IntegerField(required=False,
         widget=forms.TextInput(attrs={'class': 'text span-1'}))
     months = forms.IntegerField(required=False,
@@ -38,15 +96,114 @@ class ReminderForm(forms.ModelForm):
 
     class Meta:
         model = Reminder
-        exclude = 'owner previous next created'.split()
+        exclude = 'owner previous next start created'.split()
+
+    def clean_tags(self):
+        return normalize_tags(self.cleaned_data['tags'])
 
 
 def detail(request, key_id):
     reminder = get_object_or_404(Reminder, id=int(key_id))
+    old_next = reminder.next
+    old_interval = (reminder.days, reminder.months, reminder.years)
     reminder_form = ReminderForm(request.POST or None, instance=reminder)
     if reminder_form.is_valid():
-        reminder_form.save()
+        reminder = reminder_form.save(commit=False)
+        if (reminder.next is None or old_interval !=
+            (reminder.days, reminder.months, reminder.years)):
+            reminder.next = first_occurrence(reminder, datetime.now())
+            reminder.start = None # The new next occurrence.
+        reminder.put()
+        buckets.update([(reminder.key(), old_next, reminder.next)])
+        cache.invalidate_reminders([reminder])
         Message(message='<p class="success message">%s</p>' %
                 "Your changes were saved successfully.",
                 user=request.user).put()
     return render_to_response(request, 'reminders/detail.html', locals())
+
+
+def feed(request, owner_key, token):
+    """
+    Private iCalendar feed for calendar apps. If the ETag in memcache
+    matches, answer 304 without any datastore access.
+    """
+    if token != ical.feed_token(owner_key):
+        raise Http404
+    etag = cache.get_feed_etag(owner_key)
+    if etag and request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        return HttpResponseNotModified()
+    reminder_list = cache.get_reminder_list(owner_key)
+    etag = ical.feed_etag(reminder_list)
+    cache.set_feed_etag(owner_key, etag)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        return HttpResponseNotModified()
+    response = HttpResponse(ical.generate(reminder_list),
+                            mimetype='text/calendar; charset=utf-8')
+    response['ETag'] = etag
+    return response
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(label="iCalendar or CSV file")
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if upload.size > importer.MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(
+                "The file is too big, the limit is %d KB." %
+                (importer.MAX_UPLOAD_SIZE / 1000))
+        return upload
+
+
+@login_required
+def import_file(request):
+    """
+    Store an uploaded iCalendar or CSV file for the import worker.
+    """
+    import_form = ImportForm(request.POST or None, request.FILES or None)
+    if import_form.is_valid():
+        upload = import_form.cleaned_data['file']
+        job = ImportJob(owner=request.user, filename=upload.name)
+        job.put()
+        ImportFile(parent=job, key_name='file',
+                   data=db.Blob(upload.read())).put()
+        Message(message='<p class="success message">%s</p>' %
+                "Your file will be imported in the next few minutes.",
+                user=request.user).put()
+        return HttpResponseRedirect('/reminders/import/')
+    job_list = (ImportJob.all().filter('owner', request.user)
+                .order('-created').fetch(5))
+    return render_to_response(request, 'reminders/import.html', locals())
+
+
+@cron_or_staff
+def run_imports(request):
+    """
+    Work on the running imports, oldest first, called by cron.
+    """
+    deadline = time.time() + TIME_BUDGET
+    finished = 0
+    for job in (ImportJob.all().filter('status', 'running')
+                .order('created').fetch(BATCH_SIZE)):
+        if time.time() >= deadline:
+            break
+        if importer.run_job(job, deadline):
+            finished += 1
+    return HttpResponse("Finished %d imports.\n" % finished,
+                        mimetype="text/plain")
+
+
+@login_required
+def import_status(request, job_id):
+    """
+    Progress of an import, for polling with JavaScript.
+    """
+    job = get_object_or_404(ImportJob, id=int(job_id))
+    if ImportJob.owner.get_value_for_datastore(job) != request.user.key():
+        raise Http404
+    data = {'status': job.status,
+            'imported': job.imported,
+            'skipped': job.skipped,
+            'errors': job.errors}
+    return HttpResponse(simplejson.dumps(data),
+                        mimetype='application/json')
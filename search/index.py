@@ -0,0 +1,158 @@
+"""
+Inverted index over the titles and tags of public suggestions.
+
+The posting list of each token is split into POSTING_SHARDS
+SearchToken entities, so that common tokens stay far below the
+entity size limit, and each shard is updated in its own transaction.
+A search gets all shards of all query tokens with one batch get, and
+intersects the posting lists starting with the shortest. Code that
+saves suggestions must call index_suggestions() afterwards.
+"""
+import re
+import zlib
+
+from google.appengine.ext import db
+
+from search.models import SearchToken, SearchDocument
+from tags.normalize import singular
+
+TITLE_WEIGHT = 2
+TAG_WEIGHT = 1
+LIMIT = 20
+POSTING_SHARDS = 16
+WORD = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset("""
+a an and are as at be by every for from in is it of on or the to
+with your
+""".split())
+
+
+def tokenize(text):
+    """
+    Lowercase words without stop words, with simple plurals made
+    singular like tag names.
+    """
+    return [singular(word) for word in WORD.findall(text.lower())
+            if word not in STOP_WORDS and len(word) > 1]
+
+
+def document_tokens(suggestion):
+    """
+    Dict of token weights for one suggestion.
+    """
+    weights = {}
+    for token in tokenize(suggestion.title):
+        weights[token] = weights.get(token, 0) + TITLE_WEIGHT
+    for tag_name in suggestion.tags:
+        for token in tokenize(tag_name):
+            weights[token] = weights.get(token, 0) + TAG_WEIGHT
+    return weights
+
+
+def shard_name(token, name):
+    """
+    Key name of the posting list shard for this token and suggestion.
+    """
+    checksum = zlib.crc32(name.encode('utf-8')) & 0xffffffff
+    return '%s/%d' % (token, checksum % POSTING_SHARDS)
+
+
+def token_keys(token):
+    return [db.Key.from_path(SearchToken.kind(), '%s/%d' % (token, shard))
+            for shard in range(POSTING_SHARDS)]
+
+
+def update_postings(postings, changes):
+    """
+    Apply a dict of name: weight changes to one posting list, where
+    a weight of None removes the name.
+    """
+    weights = dict(zip(postings.names, postings.weights))
+    for name, weight in changes.items():
+        if weight is None:
+            weights.pop(name, None)
+        else:
+            weights[name] = weight
+    postings.names = sorted(weights)
+    postings.weights = [weights[name] for name in postings.names]
+
+
+def update_shard(key_name, changes):
+    """
+    Apply changes to one posting list shard, in a transaction so that
+    concurrent updates don't drop postings.
+    """
+    postings = SearchToken.get_by_key_name(key_name)
+    if postings is None:
+        postings = SearchToken(key_name=key_name)
+    update_postings(postings, changes)
+    if postings.names:
+        postings.put()
+    elif postings.is_saved():
+        postings.delete()
+
+
+def index_suggestions(suggestion_list, deleted=()):
+    """
+    Update the posting lists for saved suggestions, and for the key
+    names of deleted ones, with one transaction per changed shard.
+    """
+    names = [suggestion.key().name() for suggestion in suggestion_list]
+    names.extend(deleted)
+    if not names:
+        return
+    documents = db.get([db.Key.from_path(SearchDocument.kind(), name)
+                        for name in names])
+    changes = {}
+    for document, name in zip(documents, names):
+        if document is not None:
+            for token in document.tokens:
+                changes.setdefault(shard_name(token, name), {})[name] = None
+    new_documents = []
+    for suggestion in suggestion_list:
+        name = suggestion.key().name()
+        weights = document_tokens(suggestion)
+        for token, weight in weights.items():
+            changes.setdefault(shard_name(token, name), {})[name] = weight
+        new_documents.append(SearchDocument(key_name=name,
+                                            tokens=sorted(weights)))
+    for key_name in sorted(changes):
+        db.run_in_transaction(update_shard, key_name, changes[key_name])
+    if new_documents:
+        db.put(new_documents)
+    if deleted:
+        db.delete([db.Key.from_path(SearchDocument.kind(), name)
+                   for name in deleted])
+
+
+def search(query, limit=LIMIT):
+    """
+    Key names of the suggestions that contain all query tokens, best
+    matches first.
+    """
+    tokens = sorted(set(tokenize(query)))
+    if not tokens:
+        return []
+    keys = []
+    for token in tokens:
+        keys.extend(token_keys(token))
+    shards = db.get(keys)
+    weights_list = []
+    for index in range(len(tokens)):
+        weights = {}
+        for postings in shards[index * POSTING_SHARDS:
+                               (index + 1) * POSTING_SHARDS]:
+            if postings is not None:
+                weights.update(zip(postings.names, postings.weights))
+        if not weights:
+            return []
+        weights_list.append(weights)
+    weights_list.sort(key=len)
+    scores = weights_list[0]
+    for weights in weights_list[1:]:
+        scores = dict((name, score + weights[name])
+                      for name, score in scores.items() if name in weights)
+        if not scores:
+            return []
+    ranked = sorted((-score, name) for name, score in scores.items())
+    return [name for score, name in ranked[:limit]]
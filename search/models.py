@@ -0,0 +1,23 @@
+from google.appengine.ext import db
+
+
+class SearchToken(db.Model):
+    """
+    One shard of the posting list of a search token. The key name is
+    the token and the shard number (token/shard), and each suggestion
+    goes to the shard given by a hash of its name. The names of the
+    matching suggestions are sorted, and the weights are in the same
+    order: how often the token appears, with title words counting
+    more than tags.
+    """
+    names = db.StringListProperty(indexed=False)
+    weights = db.ListProperty(int, indexed=False)
+
+
+class SearchDocument(db.Model):
+    """
+    The tokens of one indexed suggestion, with the same key name, so
+    that changed or deleted suggestions can be removed from the
+    posting lists.
+    """
+    tokens = db.StringListProperty(indexed=False)
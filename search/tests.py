@@ -0,0 +1,81 @@
+from google.appengine.ext import db
+
+from django.test import TestCase
+
+from reminders.models import Reminder
+
+from search import index
+from search.models import SearchDocument
+
+
+class IndexTest(TestCase):
+
+    def setUp(self):
+        self.suggestion_list = [
+            Reminder(key_name='replace-smoke-alarm-batteries',
+                     title="Replace smoke alarm batteries",
+                     tags=['home', 'safety'], years=1),
+            Reminder(key_name='test-smoke-alarms',
+                     title="Test the smoke alarms", tags=['safety'],
+                     months=1),
+            Reminder(key_name='replace-car-battery',
+                     title="Replace the car battery", tags=['car'],
+                     years=4),
+            ]
+        for suggestion in self.suggestion_list:
+            suggestion.put()
+        index.index_suggestions(self.suggestion_list)
+
+    def test_tokenize(self):
+        self.assertEqual(index.tokenize("Test the Smoke-Alarms"),
+                         ['test', 'smoke', 'alarm'])
+
+    def test_search(self):
+        self.assertEqual(index.search('smoke alarm'),
+                         ['replace-smoke-alarm-batteries',
+                          'test-smoke-alarms'])
+        self.assertEqual(index.search('batteries'),
+                         ['replace-car-battery',
+                          'replace-smoke-alarm-batteries'])
+        self.assertEqual(index.search('safety test'), ['test-smoke-alarms'])
+        self.assertEqual(index.search('car smoke'), [])
+        self.assertEqual(index.search('unknown'), [])
+        self.assertEqual(index.search('the'), [])
+
+    def test_update(self):
+        suggestion = self.suggestion_list[1]
+        suggestion.title = "Check the fire extinguisher"
+        suggestion.put()
+        index.index_suggestions([suggestion])
+        self.assertEqual(index.search('smoke'),
+                         ['replace-smoke-alarm-batteries'])
+        self.assertEqual(index.search('fire'), ['test-smoke-alarms'])
+        self.assertEqual(db.get(index.token_keys('test')),
+                         [None] * index.POSTING_SHARDS)
+        index.index_suggestions([], deleted=['test-smoke-alarms'])
+        self.assertEqual(index.search('fire'), [])
+        self.assertEqual(SearchDocument.all().count(), 2)
+
+    def test_view(self):
+        response = self.client.get('/search/', {'q': 'Smoke alarm'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('>Replace smoke alarm batteries</a>'
+                        in response.content)
+        response = self.client.get('/search/', {'q': 'nothing'})
+        self.assertTrue("No suggestions match your search."
+                        in response.content)
+
+
+class RebuildTest(TestCase):
+
+    def test_rebuild(self):
+        Reminder(key_name='water-plants', title="Water the plants",
+                 tags=['garden'], days=3).put()
+        response = self.client.get('/search/rebuild/')
+        self.assertRedirects(response,
+                             '/accounts/login/?next=/search/rebuild/')
+        response = self.client.get('/search/rebuild/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Indexed 1 suggestions, finished."
+                        in response.content)
+        self.assertEqual(index.search('plant'), ['water-plants'])
@@ -0,0 +1,6 @@
+from django.conf.urls.defaults import *
+
+urlpatterns = patterns('search.views',
+    (r'^$', 'index'),
+    (r'^rebuild/$', 'rebuild'),
+)
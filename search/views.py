@@ -0,0 +1,48 @@
+import time
+
+from django.http import HttpResponse
+
+from ragendja.template import render_to_response
+
+from utils.cron import cron_or_staff, TIME_BUDGET
+from reminders.models import Reminder
+from suggestions import summary
+
+from search import index as search_index
+
+BATCH_SIZE = 50
+
+
+def index(request):
+    """
+    Search suggestions by words in the title and tags.
+    """
+    query = request.GET.get('q', '').strip()
+    if query:
+        suggestion_list = summary.get_summaries(search_index.search(query))
+    return render_to_response(request, 'search/index.html', locals())
+
+
+@cron_or_staff
+def rebuild(request):
+    """
+    Index all suggestions in batches, e.g. after the tokenizer changed.
+    Run it again with the cursor until it reports that it is finished.
+    """
+    deadline = time.time() + TIME_BUDGET
+    query = Reminder.all().filter('owner', None)
+    if request.GET.get('cursor'):
+        query.with_cursor(request.GET['cursor'])
+    indexed = 0
+    while time.time() < deadline:
+        suggestion_list = query.fetch(BATCH_SIZE)
+        search_index.index_suggestions(suggestion_list)
+        indexed += len(suggestion_list)
+        if len(suggestion_list) < BATCH_SIZE:
+            return HttpResponse(
+                "Indexed %d suggestions, finished.\n" % indexed,
+                mimetype="text/plain")
+        query.with_cursor(query.cursor())
+    return HttpResponse(
+        "Indexed %d suggestions, continue with /search/rebuild/?cursor=%s\n"
+        % (indexed, query.cursor()), mimetype="text/plain")
@@ -16,6 +16,7 @@ COMBINE_MEDIA = {
         # See documentation why site_data can be useful:
         # http://code.google.com/p/app-engine-patch/wiki/MediaGenerator
         '.site_data.js',
+        'tags/autocomplete.js',
     ),
     'combined-%(LANGUAGE_DIR)s.css': (
         'global/look.css',
@@ -27,6 +28,10 @@ COMBINE_MEDIA = {
 DEFAULT_FROM_EMAIL = 'support@minderbot.com'
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
 EMAIL_SUBJECT_PREFIX = '[Minderbot] '
+# To test the mail queue against a local SMTP stand-in, run
+# python -m smtpd -n -c DebuggingServer localhost:1025
+#EMAIL_HOST = 'localhost'
+#EMAIL_PORT = 1025
 ADMINS = (
     ('Matt Brubeck', 'mbrubeck@minderbot.com'),
     ('Johann C. Rocholl', 'jcrocholl@minderbot.com'),
@@ -111,11 +116,15 @@ INSTALLED_APPS = (
     'accounts',
     'pages',
     'feedback',
+    'counters',
     'tags',
     'suggestions',
+    'search',
     'reminders',
     'dashboard',
     'consistency',
+    'dispatch',
+    'mailqueue',
     'dumpdata',
     'mediautils',
 )
@@ -0,0 +1,267 @@
+"""
+Read-only snapshot of the public catalog: suggestions, tags, tag
+members and the precomputed related items.
+
+Writes bump the version in suggestions.version. A cron job checks
+the version every minute and builds a new snapshot if it changed,
+stored in chunks in the datastore and in memcache. Requests keep
+serving the last built snapshot, loaded once per instance, so each
+request costs one memcache get to check for a new build, and no
+datastore calls.
+"""
+import bisect
+import cPickle as pickle
+
+from google.appengine.api import memcache
+from google.appengine.ext import db
+
+from django.core.urlresolvers import reverse
+
+from reminders.models import Reminder
+from tags.models import Tag, TagMember, RelatedTags, RelatedSuggestions
+from tags.related import TOP_K
+from suggestions.models import CatalogSnapshot, CatalogChunk
+from suggestions import version
+
+DATA_KEY = 'catalog:%s' # Chunk name, version:index.
+SNAPSHOT_KEY = 'catalog-snapshot'
+SNAPSHOT_KEY_NAME = 'catalog'
+CHUNK_SIZE = 900000 # Bytes, below the memcache value limit.
+BATCH_SIZE = 100
+
+_local = {'catalog': None}
+
+
+class SuggestionRecord(object):
+    """
+    Quacks like a suggestion in templates.
+    """
+    __slots__ = ('key_name', 'title', 'interval_text', 'tags')
+
+    def __init__(self, key_name, title, interval, tags):
+        self.key_name = key_name
+        self.title = title
+        self.interval_text = interval
+        self.tags = tags
+
+    def __unicode__(self):
+        return self.title
+
+    def interval(self):
+        return self.interval_text
+
+    def get_absolute_url(self):
+        return reverse('suggestions.views.detail',
+                       kwargs={'key_name': self.key_name})
+
+
+class TagRecord(object):
+    __slots__ = ('name', 'created')
+
+    def __init__(self, name, created):
+        self.name = name
+        self.created = created
+
+    def __unicode__(self):
+        return self.name
+
+    def get_absolute_url(self):
+        return reverse('tags.views.detail', kwargs={'key_name': self.name})
+
+
+class Catalog(object):
+    """
+    Immutable after construction. members maps each tag name to the
+    sorted key names of its suggestions.
+    """
+    __slots__ = ('version', 'suggestions', 'tags', 'members',
+                 'related_tags', 'related_suggestions', 'frequencies')
+
+    def __init__(self, version, data):
+        (suggestion_rows, tag_rows, members, related_tags,
+         related_suggestions) = data
+        self.version = version
+        self.suggestions = dict(
+            (row[0], SuggestionRecord(*row)) for row in suggestion_rows)
+        self.tags = dict((row[0], TagRecord(*row)) for row in tag_rows)
+        self.members = members
+        self.related_tags = related_tags
+        self.related_suggestions = related_suggestions
+        self.frequencies = {} # Number of suggestions for each tag.
+        for record in self.suggestions.values():
+            for tag_name in set(record.tags):
+                self.frequencies[tag_name] = (
+                    self.frequencies.get(tag_name, 0) + 1)
+
+    def get_suggestions(self, key_names):
+        return [self.suggestions[key_name] for key_name in key_names
+                if key_name in self.suggestions]
+
+    def get_tag_page(self, tag_name, cursor, limit):
+        """
+        One page of a tag's suggestions and the cursor for the next
+        page, like Tag.get_suggestions. The cursor is the key name of
+        the last suggestion on the previous page, so pages stay
+        stable when a new build adds members.
+        """
+        members = self.members.get(tag_name, [])
+        start = 0
+        if cursor:
+            start = bisect.bisect_right(members, cursor)
+        names = members[start:start + limit]
+        next_cursor = None
+        if start + limit < len(members):
+            next_cursor = names[-1]
+        return self.get_suggestions(names), next_cursor
+
+
+def fetch_all(query):
+    """
+    All results of a query, in batches with cursors.
+    """
+    results = query.fetch(BATCH_SIZE)
+    while results:
+        for result in results:
+            yield result
+        if len(results) < BATCH_SIZE:
+            break
+        query.with_cursor(query.cursor())
+        results = query.fetch(BATCH_SIZE)
+
+
+def build():
+    """
+    Read the whole catalog from the datastore, as plain tuples, lists
+    and dicts that pickle compactly.
+    """
+    suggestion_rows = [
+        (suggestion.key().name(), suggestion.title, suggestion.interval(),
+         tuple(sorted(set(suggestion.tags))))
+        for suggestion in fetch_all(Reminder.all().filter('owner', None))]
+    tag_rows = []
+    members = {}
+    for tag in fetch_all(Tag.all()):
+        tag_rows.append((tag.key().name(), tag.created))
+        members[tag.key().name()] = set(tag.suggestions)
+    for key in fetch_all(TagMember.all(keys_only=True)):
+        members.setdefault(key.parent().name(), set()).add(key.name())
+    for tag_name, names in members.items():
+        members[tag_name] = sorted(names)
+    related_tags = dict(
+        (row.key().name(), zip(row.names[:TOP_K], row.counts[:TOP_K]))
+        for row in fetch_all(RelatedTags.all()))
+    related_suggestions = dict(
+        (row.key().name(), row.names[:TOP_K])
+        for row in fetch_all(RelatedSuggestions.all()))
+    return (suggestion_rows, tag_rows, members, related_tags,
+            related_suggestions)
+
+
+def chunk_name(built, index):
+    return '%s:%d' % (built, index)
+
+
+def get_built():
+    """
+    The version and chunk count of the last built snapshot, or None
+    before the first build.
+    """
+    built = memcache.get(SNAPSHOT_KEY)
+    if built is None:
+        snapshot = CatalogSnapshot.get_by_key_name(SNAPSHOT_KEY_NAME)
+        if snapshot is None:
+            return None
+        built = (snapshot.version, snapshot.count)
+        memcache.set(SNAPSHOT_KEY, built)
+    return built
+
+
+def load(built):
+    """
+    Get the data of a built snapshot from memcache, or from the
+    datastore if memcache lost some chunks. Returns None if the
+    chunks are gone, e.g. deleted after two newer builds.
+    """
+    version, count = built
+    names = [chunk_name(version, index) for index in range(count)]
+    cached = memcache.get_multi([DATA_KEY % name for name in names])
+    missing = [name for name in names if DATA_KEY % name not in cached]
+    if missing:
+        chunks = db.get([db.Key.from_path(CatalogChunk.kind(), name)
+                         for name in missing])
+        if None in chunks:
+            return None
+        found = dict((DATA_KEY % name, chunk.data)
+                     for name, chunk in zip(missing, chunks))
+        memcache.set_multi(found)
+        cached.update(found)
+    return pickle.loads(''.join([cached[DATA_KEY % name]
+                                 for name in names]))
+
+
+def save(current, data):
+    """
+    Store the data for this version in the datastore and memcache,
+    and make it the built snapshot. Chunks older than the previous
+    snapshot are deleted.
+    """
+    encoded = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    parts = [encoded[start:start + CHUNK_SIZE]
+             for start in range(0, len(encoded), CHUNK_SIZE)] or ['']
+    names = [chunk_name(current, index) for index in range(len(parts))]
+    for name, part in zip(names, parts):
+        # One put per chunk, each is close to the entity size limit.
+        CatalogChunk(key_name=name, data=db.Blob(part)).put()
+    snapshot = CatalogSnapshot.get_by_key_name(SNAPSHOT_KEY_NAME)
+    if snapshot is None:
+        snapshot = CatalogSnapshot(key_name=SNAPSHOT_KEY_NAME)
+    elif snapshot.previous_version is not None:
+        db.delete([db.Key.from_path(CatalogChunk.kind(), chunk_name(
+                        snapshot.previous_version, index))
+                   for index in range(snapshot.previous_count)])
+    snapshot.previous_version = snapshot.version
+    snapshot.previous_count = snapshot.count
+    snapshot.version = current
+    snapshot.count = len(parts)
+    snapshot.put()
+    mapping = dict((DATA_KEY % name, part)
+                   for name, part in zip(names, parts))
+    mapping[SNAPSHOT_KEY] = (current, len(parts))
+    memcache.set_multi(mapping)
+
+
+def rebuild():
+    """
+    Build the snapshot for the current version, unless it is built
+    already. Called by cron, so that requests never scan the catalog.
+    Returns True if a new snapshot was built.
+    """
+    current = version.get()
+    built = get_built()
+    if built is not None and built[0] == current:
+        return False
+    save(current, build())
+    return True
+
+
+def get_catalog():
+    """
+    The last built snapshot, loaded at most once per version in each
+    instance. Writes after the last build show up after the next
+    cron run. Only the very first request after deployment builds
+    the snapshot inline.
+    """
+    built = get_built()
+    catalog = _local['catalog']
+    if (catalog is not None and built is not None
+        and catalog.version == built[0]):
+        return catalog
+    data = built and load(built)
+    if data is None:
+        current = version.get()
+        data = build()
+        save(current, data)
+        built = (current, None)
+    catalog = Catalog(built[0], data)
+    _local['catalog'] = catalog
+    return catalog
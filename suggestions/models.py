@@ -0,0 +1,34 @@
+from google.appengine.ext import db
+
+
+class PopularityRanking(db.Model):
+    """
+    Snapshot of the most adopted suggestions, biggest first, with the
+    number of reminders created from each in the same order. There is
+    only one, rebuilt periodically by suggestions.popularity.
+    """
+    names = db.StringListProperty(indexed=False)
+    counts = db.ListProperty(int, indexed=False)
+    updated = db.DateTimeProperty(auto_now=True)
+
+
+class CatalogSnapshot(db.Model):
+    """
+    The catalog version that was built last, and the number of its
+    CatalogChunk entities. The previous version is kept too, because
+    other instances may still be loading it. There is only one, with
+    the key name 'catalog'.
+    """
+    version = db.IntegerProperty()
+    count = db.IntegerProperty()
+    previous_version = db.IntegerProperty()
+    previous_count = db.IntegerProperty()
+    updated = db.DateTimeProperty(auto_now=True)
+
+
+class CatalogChunk(db.Model):
+    """
+    One piece of a pickled catalog snapshot, with the key name
+    version:index.
+    """
+    data = db.BlobProperty()
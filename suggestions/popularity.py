@@ -0,0 +1,88 @@
+"""
+Adoption counters and the popularity ranking of suggestions.
+
+record() increments a sharded counter for each reminder created from
+a suggestion. rebuild() reads all counters and saves the TOP_N
+suggestions in one PopularityRanking entity, which is cached in
+memcache. Only the cron job calls rebuild(); pages read the stored
+ranking, never the counters.
+"""
+from google.appengine.api import memcache
+
+from counters import shards
+from reminders.models import Reminder
+from suggestions.models import PopularityRanking
+from suggestions import catalog
+
+TOP_N = 200
+KEY_NAME = 'popular'
+CACHE_KEY = 'suggestions-popular'
+BATCH_SIZE = 100
+
+
+def counter_name(key_name):
+    return 'suggestion:%s' % key_name
+
+
+def record(key_name):
+    shards.increment(counter_name(key_name))
+
+
+def get_adoptions(key_names):
+    return shards.get_counts([counter_name(key_name)
+                              for key_name in key_names])
+
+
+def rebuild():
+    """
+    Rank all suggestions by their counters, in batches of keys.
+    """
+    ranked = []
+    query = Reminder.all(keys_only=True).filter('owner', None)
+    keys = query.fetch(BATCH_SIZE)
+    while keys:
+        names = [key.name() for key in keys]
+        ranked.extend((-count, name) for name, count in
+                      zip(names, get_adoptions(names)) if count > 0)
+        if len(keys) < BATCH_SIZE:
+            break
+        query.with_cursor(query.cursor())
+        keys = query.fetch(BATCH_SIZE)
+    ranked.sort()
+    ranked = ranked[:TOP_N]
+    ranking = PopularityRanking(key_name=KEY_NAME,
+                                names=[name for count, name in ranked],
+                                counts=[-count for count, name in ranked])
+    ranking.put()
+    memcache.set(CACHE_KEY, (ranking.names, ranking.counts))
+    return ranking
+
+
+def get_ranking():
+    """
+    Lists of names and counts, most popular first. Empty until the
+    cron job has built the first ranking.
+    """
+    cached = memcache.get(CACHE_KEY)
+    if cached is None:
+        ranking = PopularityRanking.get_by_key_name(KEY_NAME)
+        if ranking is None:
+            return [], []
+        cached = (ranking.names, ranking.counts)
+        memcache.set(CACHE_KEY, cached)
+    return cached
+
+
+def get_popular(limit, offset=0):
+    names, counts = get_ranking()
+    return names[offset:offset + limit]
+
+
+def get_popular_in_tag(tag_name, limit):
+    """
+    The most popular suggestions with this tag, checked against the
+    members in the catalog snapshot without datastore calls.
+    """
+    names, counts = get_ranking()
+    members = set(catalog.get_catalog().members.get(tag_name, []))
+    return [name for name in names if name in members][:limit]
@@ -0,0 +1,67 @@
+"""
+Recommended suggestions for a user, based on the tags of the
+reminders they already have.
+
+Each suggestion that shares tags with the user's reminders scores
+the inverse document frequency of the shared tags, so rare tags
+count more than common ones. Scoring runs over the in-process
+catalog snapshot. The results are cached per user with the other
+reminder caches, together with the snapshot version, so the panel
+is one memcache read until the user's reminders or the catalog
+change.
+"""
+import math
+
+from google.appengine.api import memcache
+
+from reminders import cache
+from suggestions import summary, catalog
+
+LIMIT = 5
+
+
+def recommend(reminder_list, limit=LIMIT):
+    """
+    Key names of the best suggestions for these reminders, leaving
+    out suggestions that the user already has.
+    """
+    user_tags = set()
+    sources = set()
+    titles = set()
+    for reminder in reminder_list:
+        user_tags.update(reminder.tags)
+        sources.add(reminder.source)
+        titles.add(reminder.title.lower()) # Created before sources.
+    if not user_tags:
+        return []
+    snapshot = catalog.get_catalog()
+    count = float(len(snapshot.suggestions))
+    frequencies = snapshot.frequencies
+    weights = dict((tag_name, math.log(count / frequencies[tag_name]) + 1)
+                   for tag_name in user_tags if tag_name in frequencies)
+    ranked = []
+    for name, record in snapshot.suggestions.items():
+        if name in sources or record.title.lower() in titles:
+            continue
+        score = sum([weights.get(tag_name, 0) for tag_name in record.tags])
+        if score > 0:
+            ranked.append((-score, name))
+    ranked.sort()
+    return [name for score, name in ranked[:limit]]
+
+
+def get_recommendations(owner, reminder_list):
+    """
+    Summaries of recommended suggestions, cached per user until their
+    reminders change or a new catalog snapshot is built.
+    """
+    key = cache.RECOMMENDATIONS % cache.owner_key(owner)
+    snapshot = catalog.get_catalog()
+    cached = memcache.get(key)
+    if cached is None or cached[0] != snapshot.version:
+        items = [(record.key_name, record.title, record.interval())
+                 for record in snapshot.get_suggestions(
+                     recommend(reminder_list))]
+        cached = (snapshot.version, items)
+        memcache.set(key, cached)
+    return [summary.Summary(*item) for item in cached[1]]
@@ -0,0 +1,64 @@
+"""
+Small cached projections of public suggestions, for list pages.
+
+Each summary is the title and the interval text of one suggestion,
+stored in memcache under the suggestion key name. Listing a page of
+suggestions is then one memcache call, and full entities are only
+fetched for the misses. Code that changes a suggestion must call
+invalidate() afterwards.
+"""
+from google.appengine.api import memcache
+from google.appengine.ext import db
+
+from django.core.urlresolvers import reverse
+
+from reminders.models import Reminder
+
+KEY_PREFIX = 'suggestion-summary:'
+TIMEOUT = 3600 # Seconds, in case a suggestion is changed in the admin.
+
+
+class Summary(object):
+    """
+    Quacks like a suggestion in templates: title, interval and URL.
+    """
+
+    def __init__(self, key_name, title, interval):
+        self.key_name = key_name
+        self.title = title
+        self.interval_text = interval
+
+    def __unicode__(self):
+        return self.title
+
+    def interval(self):
+        return self.interval_text
+
+    def get_absolute_url(self):
+        return reverse('suggestions.views.detail',
+                       kwargs={'key_name': self.key_name})
+
+
+def get_summaries(key_names):
+    """
+    Summaries for these suggestion key names, in the same order.
+    Missing suggestions are left out.
+    """
+    cached = memcache.get_multi(key_names, key_prefix=KEY_PREFIX)
+    missing = [key_name for key_name in key_names if key_name not in cached]
+    if missing:
+        fetched = {}
+        for suggestion in db.get([
+                db.Key.from_path(Reminder.kind(), key_name)
+                for key_name in missing]):
+            if suggestion is not None:
+                fetched[suggestion.key().name()] = (
+                    suggestion.title, suggestion.interval())
+        memcache.set_multi(fetched, time=TIMEOUT, key_prefix=KEY_PREFIX)
+        cached.update(fetched)
+    return [Summary(key_name, *cached[key_name])
+            for key_name in key_names if key_name in cached]
+
+
+def invalidate(key_names):
+    memcache.delete_multi(key_names, key_prefix=KEY_PREFIX)
@@ -0,0 +1,13 @@
+from django import template
+from django.template.loader import render_to_string
+
+from suggestions import summary, popularity
+
+register = template.Library()
+
+
+@register.simple_tag
+def popular_suggestions(limit):
+    suggestion_list = summary.get_summaries(
+        popularity.get_popular(int(limit)))
+    return render_to_string('suggestions/popular.html', locals())
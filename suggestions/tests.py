@@ -1,10 +1,15 @@
 from datetime import datetime, timedelta
 
+from google.appengine.api import memcache
+
 from django.test import TestCase
 from django.contrib.auth.models import User
 
 from tags.models import Tag
 from reminders.models import Reminder
+from mailqueue.models import OutgoingMail
+from suggestions import views, popularity, catalog, version
+from suggestions.models import PopularityRanking, CatalogChunk
 
 
 class ClientTest(TestCase):
@@ -13,6 +18,32 @@ class ClientTest(TestCase):
         response = self.client.get('/suggestions/')
         self.assertEqual(response.status_code, 200)
 
+    def test_paging(self):
+        for title in ("Water plants", "Change oil", "Pay rent"):
+            Reminder(key_name=title.lower().replace(' ', '-'),
+                     title=title, days=7).put()
+        Reminder(owner=User.objects.create_user('user', 'user@example.com',
+                                                'pass'),
+                 title="Private", days=1).put()
+        views.PAGE_SIZE, page_size = 2, views.PAGE_SIZE
+        try:
+            response = self.client.get('/suggestions/')
+            self.assertEqual([unicode(suggestion) for suggestion in
+                              response.context['suggestion_list']],
+                             ["Change oil", "Pay rent"])
+            cursor = response.context['cursor']
+            response = self.client.get('/suggestions/', {'cursor': cursor})
+            self.assertEqual([unicode(suggestion) for suggestion in
+                              response.context['suggestion_list']],
+                             ["Water plants"])
+            self.assertFalse("More suggestions" in response.content)
+        finally:
+            views.PAGE_SIZE = page_size
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/suggestions/', {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+
 
 class SuggestionTest(TestCase):
 
@@ -28,3 +59,139 @@ class SuggestionTest(TestCase):
         self.assertTrue('safety' in suggestion.tags)
         self.assertEqual(len(suggestion.tags), 6)
         self.assertEqual(suggestion.interval(), 'week')
+
+    def test_welcome(self):
+        Reminder(key_name='pay-rent', title="Pay rent", months=1).put()
+        self.client.post('/suggestions/pay-rent/',
+                         {'email': 'new@example.com'})
+        body = OutgoingMail.all().get().body
+        url = body[body.index('/accounts/welcome/'):].split()[0]
+        self.client.logout()
+        response = self.client.post(url, {'password': 'secret',
+                                          'repeat': 'secret'})
+        self.assertRedirects(response, '/')
+        self.assertTrue(self.client.login(username='new@example.com',
+                                          password='secret'))
+        # The link works only once.
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+
+class PopularityTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+        for slug, tag_names in (('water-plants', ['garden']),
+                                ('mow-lawn', ['garden']),
+                                ('pay-rent', ['home'])):
+            Reminder(key_name=slug, title=slug, tags=tag_names,
+                     days=7).put()
+            tag = Tag.get_by_key_name(tag_names[0]) or Tag(
+                key_name=tag_names[0], count=0)
+            tag.put()
+            tag.add_member(slug)
+        User.objects.create_user('user', 'user@example.com', 'pass')
+        self.assertTrue(self.client.login(username='user@example.com',
+                                          password='pass'))
+
+    def test_create_reminder(self):
+        self.client.post('/suggestions/mow-lawn/')
+        self.client.post('/suggestions/mow-lawn/')
+        self.client.post('/suggestions/pay-rent/')
+        reminder = Reminder.all().filter('owner !=', None).get()
+        self.assertTrue(reminder.source in ('mow-lawn', 'pay-rent'))
+        self.assertEqual(popularity.get_adoptions(
+                ['mow-lawn', 'pay-rent', 'water-plants']), [2, 1, 0])
+        ranking = popularity.rebuild()
+        self.assertEqual(ranking.names, ['mow-lawn', 'pay-rent'])
+        self.assertEqual(ranking.counts, [2, 1])
+
+    def test_no_rebuild_in_requests(self):
+        popularity.record('pay-rent')
+        self.assertEqual(popularity.get_ranking(), ([], []))
+        response = self.client.get('/tags/home/')
+        self.assertEqual(response.context['popular_list'], [])
+        self.assertEqual(PopularityRanking.all().count(), 0)
+
+    def test_pages(self):
+        popularity.record('pay-rent')
+        popularity.record('water-plants')
+        popularity.record('water-plants')
+        response = self.client.get('/suggestions/popular/rebuild/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Ranked 2 suggestions." in response.content)
+        response = self.client.get('/suggestions/', {'sort': 'popular'})
+        self.assertEqual([suggestion.key_name for suggestion in
+                          response.context['suggestion_list']],
+                         ['water-plants', 'pay-rent'])
+        response = self.client.get('/tags/garden/')
+        self.assertEqual([suggestion.key_name for suggestion in
+                          response.context['popular_list']],
+                         ['water-plants'])
+        response = self.client.get('/')
+        self.assertTrue('<a href="/suggestions/water-plants/">'
+                        in response.content)
+
+
+class CatalogTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+        catalog._local['catalog'] = None
+        Reminder(key_name='water-plants', title="Water plants", days=7,
+                 tags=['garden', 'home', 'garden']).put()
+        tag = Tag(key_name='garden', count=1)
+        tag.put()
+        tag.add_member('water-plants')
+
+    def test_snapshot(self):
+        snapshot = catalog.get_catalog()
+        record = snapshot.suggestions['water-plants']
+        self.assertEqual(unicode(record), "Water plants")
+        self.assertEqual(record.interval(), 'week')
+        self.assertEqual(record.tags, ('garden', 'home'))
+        self.assertEqual(record.get_absolute_url(),
+                         '/suggestions/water-plants/')
+        self.assertEqual(snapshot.members, {'garden': ['water-plants']})
+        self.assertEqual(snapshot.frequencies, {'garden': 1, 'home': 1})
+        suggestion_list, cursor = snapshot.get_tag_page('garden', None, 10)
+        self.assertEqual([item.key_name for item in suggestion_list],
+                         ['water-plants'])
+        self.assertEqual(cursor, None)
+        self.assertTrue(catalog.get_catalog() is snapshot)
+
+    def test_version(self):
+        snapshot = catalog.get_catalog()
+        self.assertFalse(catalog.rebuild())
+        Reminder(key_name='pay-rent', title="Pay rent", days=30).put()
+        version.bump()
+        # Requests keep the last built snapshot until the cron job.
+        self.assertTrue(catalog.get_catalog() is snapshot)
+        self.assertTrue(catalog.rebuild())
+        self.assertTrue('pay-rent' in catalog.get_catalog().suggestions)
+        response = self.client.get('/suggestions/catalog/rebuild/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("The catalog is up to date." in response.content)
+
+    def test_datastore(self):
+        snapshot = catalog.get_catalog()
+        catalog._local['catalog'] = None
+        memcache.flush_all()
+        Reminder(key_name='pay-rent', title="Pay rent", days=30).put()
+        # Another instance loads the same snapshot from the datastore.
+        self.assertEqual(sorted(catalog.get_catalog().suggestions),
+                         sorted(snapshot.suggestions))
+        self.assertEqual(CatalogChunk.all().count(), 1)
+
+    def test_pages(self):
+        response = self.client.get('/suggestions/water-plants/')
+        self.assertTrue("Water plants" in response.content)
+        response = self.client.get('/suggestions/pay-rent/')
+        self.assertEqual(response.status_code, 404)
+        # Saved after the snapshot was built.
+        Reminder(key_name='pay-rent', title="Pay rent", days=30).put()
+        response = self.client.get('/suggestions/pay-rent/')
+        self.assertTrue("Pay rent" in response.content)
+        response = self.client.get('/tags/garden/')
+        self.assertTrue('<a href="/suggestions/water-plants/">'
+                        in response.content)
@@ -1,16 +1,8 @@
 from django.conf.urls.defaults import *
-from django.views.generic.list_detail import object_list, object_detail
-
-from reminders.models import Reminder
-
-info_dict = {
-    'queryset': Reminder.all().filter('owner', None),
-    'template_object_name': 'suggestion',
-}
 
 urlpatterns = patterns('suggestions.views',
-    url(r'^$', object_list,
-        dict(info_dict, template_name='suggestions/index.html'),
-        name='suggestion_list'),
+    url(r'^$', 'index', name='suggestion_list'),
+    url(r'^popular/rebuild/$', 'rebuild_ranking'),
+    url(r'^catalog/rebuild/$', 'rebuild_catalog'),
     url(r'^(?P<key_name>[a-z0-9-]+)/$', 'detail'),
 )
@@ -0,0 +1,30 @@
+"""
+Version number of the public catalog, stored in memcache.
+
+Every code path that writes suggestions, tags or tag members must
+call bump() afterwards, so that the cron job in suggestions.catalog
+builds a new snapshot.
+"""
+import time
+
+from google.appengine.api import memcache
+
+VERSION_KEY = 'catalog-version'
+
+
+def get():
+    """
+    The current version. If memcache lost it, start a new one that
+    is different from any version before.
+    """
+    version = memcache.get(VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1000000)
+        if not memcache.add(VERSION_KEY, version):
+            version = memcache.get(VERSION_KEY)
+    return version
+
+
+def bump():
+    if memcache.incr(VERSION_KEY) is None:
+        get()
@@ -1,9 +1,11 @@
 import logging
+from datetime import datetime
 
 from django import forms
-from django.conf import settings
-from django.core.mail import send_mail
-from django.http import HttpResponseRedirect
+from google.appengine.ext import db
+
+from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponseBadRequest
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User, Message
 
@@ -11,7 +13,77 @@ from ragendja.template import render_to_response
 from ragendja.dbutils import get_object_or_404
 
 from utils.english_passwords import generate_password
+from utils.cron import cron_or_staff
+from accounts.views import welcome_url
 from reminders.models import Reminder
+from reminders.recurrence import first_occurrence
+from reminders import cache
+from dispatch import buckets
+from tags import trending
+from suggestions import summary, popularity, catalog
+from mailqueue import outbox
+
+PAGE_SIZE = 20
+
+
+def index(request):
+    """
+    All public suggestions in title order, one page at a time, or the
+    most popular ones. Only keys are fetched, the titles come from the
+    cached summaries.
+    """
+    if request.GET.get('sort') == 'popular':
+        return popular(request)
+    query = Reminder.all(keys_only=True).filter('owner', None).order('title')
+    try:
+        if request.GET.get('cursor'):
+            query.with_cursor(request.GET['cursor'])
+        keys = query.fetch(PAGE_SIZE)
+    except (db.BadValueError, db.BadRequestError):
+        return HttpResponseBadRequest("Invalid cursor.")
+    suggestion_list = summary.get_summaries([key.name() for key in keys])
+    if len(keys) == PAGE_SIZE:
+        cursor = query.cursor()
+    return render_to_response(request, 'suggestions/index.html', locals())
+
+
+def popular(request):
+    """
+    Pages of the materialized popularity ranking.
+    """
+    try:
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid offset.")
+    names = popularity.get_popular(PAGE_SIZE, max(offset, 0))
+    suggestion_list = summary.get_summaries(names)
+    sort = 'popular'
+    if len(names) == PAGE_SIZE:
+        next_offset = offset + PAGE_SIZE
+    return render_to_response(request, 'suggestions/index.html', locals())
+
+
+@cron_or_staff
+def rebuild_ranking(request):
+    """
+    Materialize the popularity ranking, called by cron.
+    """
+    ranking = popularity.rebuild()
+    return HttpResponse("Ranked %d suggestions.\n" % len(ranking.names),
+                        mimetype="text/plain")
+
+
+@cron_or_staff
+def rebuild_catalog(request):
+    """
+    Build a new catalog snapshot if the catalog changed, called by
+    cron.
+    """
+    if catalog.rebuild():
+        message = "Built catalog version %s." % catalog.get_built()[0]
+    else:
+        message = "The catalog is up to date."
+    return HttpResponse(message + '\n', mimetype="text/plain")
 
 
 class EmailForm(forms.Form):
@@ -24,10 +96,10 @@ def detail(request, key_name):
     Show details for a public suggestion, and a button to create a
     reminder from it.
     """
-    suggestion = get_object_or_404(Reminder, key_name=key_name)
     logging.debug(request.method)
     email_form = EmailForm(request.POST)
     if request.method == "POST":
+        suggestion = get_object_or_404(Reminder, key_name=key_name)
         user = request.user
         if user.is_anonymous() and email_form.is_valid():
             email = email_form.cleaned_data['email']
@@ -38,6 +110,14 @@ def detail(request, key_name):
                     (email, request.path))
             user = create_user(request, email)
         return create_reminder(request, user, suggestion)
+    # Read-only views come from the catalog snapshot. Suggestions
+    # saved after the last build are read from the datastore.
+    snapshot = catalog.get_catalog()
+    suggestion = snapshot.suggestions.get(key_name)
+    if suggestion is None:
+        suggestion = get_object_or_404(Reminder, key_name=key_name)
+    related_list = snapshot.get_suggestions(
+        snapshot.related_suggestions.get(key_name, []))
     return render_to_response(
         request, 'suggestions/detail.html', locals())
 
@@ -51,8 +131,14 @@ def create_reminder(request, user, suggestion):
         months=suggestion.months,
         years=suggestion.years,
         miles=suggestion.miles,
-        kilometers=suggestion.kilometers)
+        kilometers=suggestion.kilometers,
+        source=suggestion.key().name())
+    reminder.next = first_occurrence(reminder, datetime.now())
     reminder.put()
+    buckets.update([(reminder.key(), None, reminder.next)])
+    cache.invalidate([user])
+    trending.record(reminder.tags, datetime.now())
+    popularity.record(suggestion.key().name())
     Message(message='<p class="success message">%s</p>' %
             "Your reminder was created successfully. You can edit it below.",
             user=user).put()
@@ -60,21 +146,24 @@ def create_reminder(request, user, suggestion):
 
 
 def create_user(request, email):
+    # Nobody ever sees this password, the user chooses one from the
+    # link in the welcome message.
     password = generate_password(digits=1)
     User.objects.create_user(email, email, password)
     user = authenticate(username=email, password=password)
     assert user
     login(request, user)
     assert user.is_authenticated()
-    send_mail("Welcome to Minderbot", """\
+    url = welcome_url(user)
+    outbox.enqueue("Welcome to Minderbot", """\
 We have created a user account on www.minderbot.com for you.
 If you have not requested reminders for this email address,
 you can ignore this message.
 
 Your username is your email address: %(email)s
-You can login with this password: %(password)s
+To choose your password, open this link:
+http://www.minderbot.com%(url)s
 
 Thank you for using Minderbot!
-""" % locals(), settings.DEFAULT_FROM_EMAIL, [email],
-fail_silently=True)
+""" % locals(), [email])
     return user
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from tags.models import Tag
+from tags.models import Tag, TagAlias
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -8,3 +8,10 @@ class TagAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Tag, TagAdmin)
+
+
+class TagAliasAdmin(admin.ModelAdmin):
+    list_display = ('__unicode__', 'target')
+
+
+admin.site.register(TagAlias, TagAliasAdmin)
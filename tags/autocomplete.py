@@ -0,0 +1,59 @@
+"""
+Prefix index over tag names, for autocomplete.
+
+The index is a snapshot of all tag names in sorted order, with the
+number of suggestions of each tag in a parallel list. A prefix lookup
+is a binary search plus a short scan. The index is derived from the
+catalog snapshot, which cron rebuilds after tag writes, so lookups
+never scan the tags: they serve the last built copy until a new one
+is ready. Each instance checks for a new catalog every LOCAL_TTL
+seconds, so most lookups don't need any RPC.
+"""
+import time
+from bisect import bisect_left
+
+from suggestions import catalog
+
+LOCAL_TTL = 60 # Seconds before checking for a newer catalog.
+LIMIT = 10
+MAX_SCAN = 1000 # Matches to rank for very short prefixes.
+
+_local = {'names': [], 'counts': [], 'version': None, 'loaded': 0}
+
+
+def get_snapshot(now=None):
+    """
+    Sorted tag names and their counts, rebuilt in memory at most once
+    for each catalog version.
+    """
+    if now is None:
+        now = time.time()
+    if now - _local['loaded'] >= LOCAL_TTL:
+        snapshot = catalog.get_catalog()
+        if snapshot.version != _local['version']:
+            names = sorted(snapshot.tags)
+            _local['names'] = names
+            _local['counts'] = [len(snapshot.members.get(name, []))
+                                for name in names]
+            _local['version'] = snapshot.version
+        _local['loaded'] = now
+    return _local['names'], _local['counts']
+
+
+def lookup(prefix, limit=LIMIT):
+    """
+    Tag names that start with prefix, as (name, total) pairs, biggest
+    first.
+    """
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return []
+    names, counts = get_snapshot()
+    matches = []
+    index = bisect_left(names, prefix)
+    while (index < len(names) and len(matches) < MAX_SCAN
+           and names[index].startswith(prefix)):
+        matches.append((-counts[index], names[index]))
+        index += 1
+    matches.sort()
+    return [(name, -count) for count, name in matches[:limit]]
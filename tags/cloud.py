@@ -0,0 +1,117 @@
+"""
+Tag cloud served from a snapshot.
+
+The snapshot entity holds the biggest tags and their totals. Tag
+writes only touch the sharded counters and mark the tag as changed;
+update() applies the changed totals to the snapshot, called by cron
+every few minutes, so the single snapshot entity is never written on
+the request path. A tag that shrinks keeps its place until a bigger
+tag changes, so rebuild() recomputes the snapshot from all tags once
+a day. The rendered list is cached in memcache, so the tag index page
+doesn't need any datastore queries in steady state.
+"""
+from google.appengine.api import memcache
+from google.appengine.ext import db
+
+from tags.models import Tag, TagCloud, CloudChange, font_size
+from tags.models import CLOUD_SIZE, CLOUD_KEY_NAME, CLOUD_CACHE_KEY
+from tags.models import CHANGED_KEY
+
+BATCH_SIZE = 100
+
+
+def get_cloud():
+    """
+    List of (tag name, total, font size) tuples, sorted by name. The
+    list is empty until cron builds the first snapshot.
+    """
+    tag_list = memcache.get(CLOUD_CACHE_KEY)
+    if tag_list is None:
+        cloud = TagCloud.get_by_key_name(CLOUD_KEY_NAME)
+        tag_list = []
+        if cloud is not None:
+            tag_list = sorted(
+                (name, count, font_size(count))
+                for name, count in zip(cloud.names, cloud.counts))
+        memcache.set(CLOUD_CACHE_KEY, tag_list)
+    return tag_list
+
+
+def update():
+    """
+    Apply the totals of the tags that changed since the last update
+    to the snapshot, or build the first snapshot. Returns the number
+    of changed tags.
+    """
+    cloud = TagCloud.get_by_key_name(CLOUD_KEY_NAME)
+    if cloud is None:
+        return len(rebuild().names)
+    totals = {}
+    query = CloudChange.all(keys_only=True)
+    keys = query.fetch(BATCH_SIZE)
+    while keys:
+        names = [key.name() for key in keys]
+        # Clear the markers first, so that changes during the update
+        # are marked again for the next one.
+        memcache.delete_multi(names, key_prefix=CHANGED_KEY)
+        db.delete(keys)
+        tag_list = [tag for tag in Tag.get_by_key_name(names) if tag]
+        Tag.prefetch_totals(tag_list)
+        for name in names:
+            totals[name] = 0
+        for tag in tag_list:
+            totals[tag.key().name()] = tag.get_total()
+        if len(keys) < BATCH_SIZE:
+            break
+        query.with_cursor(query.cursor())
+        keys = query.fetch(BATCH_SIZE)
+    if not totals:
+        return 0
+    entries = dict(zip(cloud.names, cloud.counts))
+    for name, total in totals.items():
+        if total <= 0:
+            entries.pop(name, None)
+        elif name in entries or len(entries) < CLOUD_SIZE:
+            entries[name] = total
+        else:
+            smallest = min(entries, key=entries.get)
+            if total > entries[smallest]:
+                del entries[smallest]
+                entries[name] = total
+    save(cloud, sorted([(total, name) for name, total in entries.items()],
+                       reverse=True))
+    return len(totals)
+
+
+def rebuild():
+    """
+    Compute the totals of all tags, in batches, and save the biggest
+    ones as the new snapshot.
+    """
+    totals = []
+    query = Tag.all()
+    tag_list = query.fetch(BATCH_SIZE)
+    while tag_list:
+        Tag.prefetch_totals(tag_list)
+        totals.extend((tag.get_total(), tag.key().name())
+                      for tag in tag_list if tag.get_total() > 0)
+        if len(tag_list) < BATCH_SIZE:
+            break
+        query.with_cursor(query.cursor())
+        tag_list = query.fetch(BATCH_SIZE)
+    totals.sort(reverse=True)
+    cloud = TagCloud(key_name=CLOUD_KEY_NAME)
+    save(cloud, totals)
+    return cloud
+
+
+def save(cloud, totals):
+    """
+    Save the biggest of the (total, name) pairs, sorted biggest
+    first, in the snapshot.
+    """
+    totals = totals[:CLOUD_SIZE]
+    cloud.names = [name for total, name in totals]
+    cloud.counts = [total for total, name in totals]
+    cloud.put()
+    memcache.delete(CLOUD_CACHE_KEY)
@@ -0,0 +1,27 @@
+// Suggest existing tags for the last word in tag input fields.
+$(document).ready(function() {
+  $('input.autocomplete').each(function() {
+    var input = $(this);
+    var list = $('<span class="autocomplete small"></span>');
+    input.after(list);
+    input.keyup(function() {
+      var words = input.val().split(' ');
+      var prefix = words[words.length - 1];
+      if (!prefix) {
+        list.empty();
+        return;
+      }
+      $.getJSON('/tags/_autocomplete/', {q: prefix}, function(data) {
+        list.empty();
+        $.each(data.tags, function(i, tag) {
+          $('<a href="#"></a>').text(tag.name).click(function() {
+            words[words.length - 1] = tag.name;
+            input.val(words.join(' ') + ' ').focus();
+            list.empty();
+            return false;
+          }).appendTo(list.append(' '));
+        });
+      });
+    });
+  });
+});
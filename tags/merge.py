@@ -0,0 +1,140 @@
+"""
+Merge one tag into another, or rename it.
+
+The work is split into chunks of CHUNK_SIZE, and the job saves its
+query cursor after each chunk, so that run() can stop at a deadline
+and continue in the next request. The first phase rewrites the tags
+list of every reminder and suggestion with the source tag, and
+moves the TagMember entities of the suggestions. The second phase
+moves any remaining members, e.g. of suggestions that didn't list
+the tag. Finally the target count is recomputed, the target keeps
+the earlier created timestamp, and the source tag is deleted.
+"""
+import time
+
+from google.appengine.ext import db
+
+from reminders.models import Reminder
+from reminders import cache
+from tags.models import Tag, TagMember, TagMerge, member_key, tag_key
+from tags import related
+from tags.normalize import normalize
+from search import index as search_index
+from suggestions import version
+
+CHUNK_SIZE = 50
+
+
+def start(source, target):
+    """
+    Create the job. The target is normalized, so that normal tag
+    writes can reach it. Old suggestions lists are migrated first,
+    so that only members need to be moved.
+    """
+    target = normalize(target)
+    for tag_name in (source, target):
+        tag = Tag.get_by_key_name(tag_name)
+        if tag is not None:
+            tag.migrate()
+    job = TagMerge(source=source, target=target)
+    job.put()
+    return job
+
+
+def run(job, deadline):
+    """
+    Process chunks until the job is done or the deadline is reached.
+    Returns True if the job is done.
+    """
+    while job.status == 'running' and time.time() < deadline:
+        if job.phase == 'reminders':
+            more = merge_reminders(job)
+            if not more:
+                job.phase = 'members'
+                job.cursor = None
+        else:
+            if not move_members(job):
+                finish(job)
+        job.put()
+    return job.status == 'done'
+
+
+def replace_tag(tag_list, source, target):
+    result = []
+    for tag_name in tag_list:
+        if tag_name == source:
+            tag_name = target
+        if tag_name not in result:
+            result.append(tag_name)
+    return result
+
+
+def merge_reminders(job):
+    """
+    Rewrite the tags of one chunk of reminders and suggestions.
+    Returns False if there were none left.
+    """
+    query = Reminder.all().filter('tags', job.source)
+    if job.cursor:
+        query.with_cursor(job.cursor)
+    reminder_list = query.fetch(CHUNK_SIZE)
+    if not reminder_list:
+        return False
+    job.cursor = query.cursor()
+    changes = []
+    suggestion_list = []
+    new_members = []
+    old_members = []
+    for reminder in reminder_list:
+        old_tags = list(reminder.tags)
+        reminder.tags = replace_tag(reminder.tags, job.source, job.target)
+        if Reminder.owner.get_value_for_datastore(reminder) is None:
+            slug = reminder.key().name()
+            changes.append((old_tags, reminder.tags))
+            suggestion_list.append(reminder)
+            new_members.append(TagMember(parent=tag_key(job.target),
+                                         key_name=slug))
+            old_members.append(member_key(job.source, slug))
+    db.put(reminder_list + new_members)
+    if old_members:
+        db.delete(old_members)
+    related.update_many_tags(changes)
+    search_index.index_suggestions(suggestion_list)
+    cache.invalidate_reminders(reminder_list)
+    version.bump()
+    job.moved += len(reminder_list)
+    return True
+
+
+def move_members(job):
+    """
+    Move one chunk of remaining members from the source to the target.
+    Returns False if there were none left.
+    """
+    keys = TagMember.all(keys_only=True).ancestor(
+        tag_key(job.source)).fetch(CHUNK_SIZE)
+    if not keys:
+        return False
+    db.put([TagMember(parent=tag_key(job.target), key_name=key.name())
+            for key in keys])
+    db.delete(keys)
+    version.bump()
+    return True
+
+
+def finish(job):
+    """
+    Recompute the target count, keep the earlier timestamp, and delete
+    the source tag.
+    """
+    source = Tag.get_by_key_name(job.source)
+    target = Tag.get_by_key_name(job.target)
+    if target is None:
+        target = Tag(key_name=job.target, count=0)
+    if source is not None:
+        if target.created is None or (source.created is not None and
+                                      source.created < target.created):
+            target.created = source.created
+        source.set_count(0)
+    target.set_count(len(target.get_member_names()))
+    job.status = 'done'
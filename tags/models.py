@@ -1,12 +1,29 @@
+from google.appengine.api import memcache
 from google.appengine.ext import db
 
 from django.core.urlresolvers import reverse
 
+from counters import shards
+from suggestions import version, summary
+
+PAGE_SIZE = 50
+MIGRATE_BATCH_SIZE = 100
+CLOUD_SIZE = 100
+CLOUD_KEY_NAME = 'cloud'
+CLOUD_CACHE_KEY = 'tag-cloud'
+CHANGED_KEY = 'tag-changed:'
+ALIAS_CACHE_KEY = 'tag-aliases'
+
 
 class Tag(db.Model):
     """
     Each tag has a list of matching reminders. For performance, the
     tag name is the datastore key name, not a StringProperty.
+
+    New suggestions don't write the count property, because popular
+    tags would get too many concurrent writes. They increment a
+    sharded counter instead, and the total is the stored count plus
+    the sharded counter.
     """
     suggestions = db.StringListProperty()
     count = db.IntegerProperty(required=True)
@@ -20,10 +37,254 @@ class Tag(db.Model):
                        kwargs={'key_name': self.key().name()})
 
     def get_font_size(self):
-        pixels = 14 + min(20, self.count)
-        return '%dpx' % pixels
+        return font_size(self.get_total())
+
+    def get_member_names(self):
+        """
+        Key names of all matching suggestions, from the old list and
+        from the members.
+        """
+        query = TagMember.all(keys_only=True).ancestor(self)
+        return self.suggestions + [key.name() for key in query]
+
+    def get_suggestions(self, cursor=None, limit=PAGE_SIZE):
+        """
+        One page of matching suggestions in key name order, and the
+        cursor for the next page, or None after the last page. The
+        cursor is the key name of the last suggestion on the page,
+        like the cursors of the catalog snapshot. The suggestions are
+        cached summaries, not full entities. Tags with an old
+        suggestions list must be migrated first.
+        """
+        query = TagMember.all(keys_only=True).ancestor(self).order('__key__')
+        if cursor:
+            query.filter('__key__ >', member_key(self.key().name(), cursor))
+        keys = query.fetch(limit + 1)
+        next_cursor = None
+        if len(keys) > limit:
+            keys = keys[:limit]
+            next_cursor = keys[-1].name()
+        return summary.get_summaries([key.name() for key in keys]), next_cursor
+
+    def add_member(self, suggestion_key_name):
+        TagMember(parent=self, key_name=suggestion_key_name).put()
+        version.bump()
+
+    def remove_member(self, suggestion_key_name):
+        db.delete(member_key(self.key().name(), suggestion_key_name))
+        version.bump()
+
+    def migrate(self):
+        """
+        Move the old suggestions list to TagMember entities. The
+        members are written in batches outside any transaction,
+        which is safe to repeat because their key names are the
+        slugs. Then the moved slugs are removed from the list in one
+        small transaction.
+        """
+        if not self.suggestions:
+            return
+        slugs = []
+        for slug in self.suggestions:
+            if slug not in slugs:
+                slugs.append(slug)
+        for start in range(0, len(slugs), MIGRATE_BATCH_SIZE):
+            db.put([TagMember(parent=self, key_name=slug)
+                    for slug in slugs[start:start + MIGRATE_BATCH_SIZE]])
+        moved = set(slugs)
+
+        def txn():
+            tag = Tag.get(self.key())
+            tag.suggestions = [slug for slug in tag.suggestions
+                               if slug not in moved]
+            tag.put()
+            return tag.suggestions
+        self.suggestions = db.run_in_transaction(txn)
+
+    def counter_name(self):
+        return 'tag:%s' % self.key().name()
+
+    def get_total(self):
+        if getattr(self, '_total', None) is None:
+            self._total = self.count + shards.get_count(self.counter_name())
+        return self._total
+
+    def increment(self, delta=1):
+        shards.increment(self.counter_name(), delta)
+        self._total = None
+        mark_changed([self.key().name()])
+
+    @classmethod
+    def increment_all(cls, changes):
+        """
+        Apply a list of (tag, delta) pairs with one shards call.
+        """
+        shards.increment_multi(dict(
+                (tag.counter_name(), delta) for tag, delta in changes))
+        for tag, delta in changes:
+            tag._total = None
+        mark_changed([tag.key().name() for tag, delta in changes])
+
+    def set_count(self, count):
+        """
+        Save an exact count and reset the sharded counter, or delete
+        the tag if the count is zero.
+        """
+        self.count = count
+        if count:
+            self.put()
+        else:
+            self.delete()
+        shards.reset(self.counter_name())
+        self._total = None
+        mark_changed([self.key().name()])
+        version.bump()
+
+    @classmethod
+    def prefetch_totals(cls, tag_list):
+        """
+        Get the totals for many tags with one memcache call.
+        """
+        totals = shards.get_counts([tag.counter_name() for tag in tag_list])
+        for tag, total in zip(tag_list, totals):
+            tag._total = tag.count + total
+
+
+class TagMember(db.Model):
+    """
+    One suggestion with this tag. The parent is the tag key, and the
+    key name is the suggestion slug, so each pair is stored once, and
+    large tags never rewrite a long list.
+    """
+    created = db.DateTimeProperty(auto_now_add=True)
+
+
+def tag_key(tag_name):
+    return db.Key.from_path(Tag.kind(), tag_name)
+
+
+def member_key(tag_name, suggestion_key_name):
+    return db.Key.from_path(TagMember.kind(), suggestion_key_name,
+                            parent=tag_key(tag_name))
+
+
+class TagCloud(db.Model):
+    """
+    Snapshot of the CLOUD_SIZE biggest tags, with their totals in
+    the same order as the names. There is only one, with the key
+    name CLOUD_KEY_NAME, and only the cron jobs in tags.cloud write
+    it.
+    """
+    names = db.StringListProperty(indexed=False)
+    counts = db.ListProperty(int, indexed=False)
+    updated = db.DateTimeProperty(auto_now=True)
+
+
+class CloudChange(db.Model):
+    """
+    Marks the tag in the key name as changed since the last cloud
+    update, see mark_changed().
+    """
+    created = db.DateTimeProperty(auto_now_add=True)
+
+
+def mark_changed(tag_names):
+    """
+    Remember that the totals of these tags changed, for the next
+    incremental cloud update. A memcache flag per tag makes sure that
+    each marker is written once between updates, so popular tags
+    don't get a datastore write on every change. If memcache loses
+    a flag, the marker is simply written again.
+    """
+    flags = dict((tag_name, True) for tag_name in tag_names)
+    existing = memcache.add_multi(flags, key_prefix=CHANGED_KEY)
+    new_names = [tag_name for tag_name in flags if tag_name not in existing]
+    if new_names:
+        db.put([CloudChange(key_name=tag_name) for tag_name in new_names])
+
+
+class RelatedTags(db.Model):
+    """
+    Sparse row of the tag co-occurrence matrix. The key name is the
+    tag name, and the other tags are sorted by the number of
+    suggestions they share with it, biggest first, so that the top
+    entries are a slice.
+    """
+    names = db.StringListProperty(indexed=False)
+    counts = db.ListProperty(int, indexed=False)
+
+
+class RelatedSuggestions(db.Model):
+    """
+    The suggestions that share the most tags with the suggestion in
+    the key name, biggest first.
+    """
+    names = db.StringListProperty(indexed=False)
+    scores = db.ListProperty(int, indexed=False)
+
+
+class TagAlias(db.Model):
+    """
+    Maps the tag name in the key name to the preferred tag name,
+    e.g. auto to car. Saving or deleting an alias clears the cached
+    alias table.
+    """
+    target = db.StringProperty(required=True)
+
+    def __unicode__(self):
+        return self.key().name()
+
+    def put(self):
+        key = super(TagAlias, self).put()
+        memcache.delete(ALIAS_CACHE_KEY)
+        return key
+
+    def delete(self):
+        super(TagAlias, self).delete()
+        memcache.delete(ALIAS_CACHE_KEY)
+
+
+class HourlyActivity(db.Model):
+    """
+    Number of reminders created from suggestions per tag, in one
+    shard of the hour in the key name (YYYYMMDDHH/shard), or in the
+    whole hour after the shards were rolled up (YYYYMMDDHH). The
+    counts are in the same order as the names.
+    """
+    names = db.StringListProperty(indexed=False)
+    counts = db.ListProperty(int, indexed=False)
+
+
+class DailyActivity(db.Model):
+    """
+    Sum of the hourly activity of a whole day, with the key name
+    YYYYMMDD.
+    """
+    names = db.StringListProperty(indexed=False)
+    counts = db.ListProperty(int, indexed=False)
+
+
+class TagMerge(db.Model):
+    """
+    Progress of merging the source tag into the target tag, or
+    renaming it if the target doesn't exist yet. The query cursor is
+    saved after each chunk, so that large tags can be merged across
+    several requests.
+    """
+    source = db.StringProperty(required=True)
+    target = db.StringProperty(required=True)
+    status = db.StringProperty(default='running',
+                               choices=('running', 'done'))
+    phase = db.StringProperty(default='reminders',
+                              choices=('reminders', 'members'))
+    cursor = db.TextProperty()
+    moved = db.IntegerProperty(default=0)
+    created = db.DateTimeProperty(auto_now_add=True)
+    updated = db.DateTimeProperty(auto_now=True)
+
+    def __unicode__(self):
+        return u'%s \u2192 %s' % (self.source, self.target)
+
 
-    def get_suggestions(self):
-        keys = [db.Key.from_path('reminders_reminder', key_name)
-                for key_name in self.suggestions]
-        return db.get(keys)
+def font_size(count):
+    return '%dpx' % (14 + min(20, count))
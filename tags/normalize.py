@@ -0,0 +1,82 @@
+"""
+Normalized tag names.
+
+Every code path that writes tags should pass them through
+normalize_tags(), so that variants like Car, cars and car end up as
+one tag. A name is lowercased, stripped of anything but letters and
+digits, and a simple plural is made singular. The TagAlias table can
+map any name, before or after stemming, to a preferred tag. The
+table is cached in memcache, and in memory for LOCAL_TTL seconds.
+"""
+import re
+import time
+
+from google.appengine.api import memcache
+
+from tags.models import TagAlias, ALIAS_CACHE_KEY
+
+LOCAL_TTL = 60 # Seconds before checking memcache for changes.
+INVALID = re.compile(r'[^a-z0-9]')
+KEEP_ENDINGS = ('ss', 'us', 'is') # Not plurals: glass, bus, analysis.
+
+_local = {'aliases': {}, 'loaded': 0}
+
+
+def get_aliases(now=None):
+    if now is None:
+        now = time.time()
+    if now - _local['loaded'] >= LOCAL_TTL:
+        aliases = memcache.get(ALIAS_CACHE_KEY)
+        if aliases is None:
+            aliases = dict((alias.key().name(), alias.target)
+                           for alias in TagAlias.all())
+            memcache.set(ALIAS_CACHE_KEY, aliases)
+        _local['aliases'] = aliases
+        _local['loaded'] = now
+    return _local['aliases']
+
+
+def invalidate():
+    """
+    Reload the alias table on the next call in this instance. Other
+    instances notice changes after LOCAL_TTL seconds.
+    """
+    _local['loaded'] = 0
+
+
+def singular(name):
+    if len(name) > 4 and name.endswith('ies'):
+        return name[:-3] + 'y'
+    if len(name) > 4 and name.endswith('sses'):
+        return name[:-2]
+    if len(name) > 3 and name.endswith('s') and not name.endswith(
+        KEEP_ENDINGS):
+        return name[:-1]
+    return name
+
+
+def normalize(name):
+    """
+    The normalized form of one tag name, or an empty string.
+    """
+    aliases = get_aliases()
+    name = INVALID.sub('', name.lower())
+    if name in aliases:
+        return aliases[name]
+    name = singular(name)
+    return aliases.get(name, name)
+
+
+def normalize_tags(tags):
+    """
+    Normalize a string of whitespace-separated tags, or a list, and
+    remove empty and duplicate names. The order is kept.
+    """
+    if isinstance(tags, basestring):
+        tags = tags.split()
+    result = []
+    for name in tags:
+        name = normalize(name)
+        if name and name not in result:
+            result.append(name)
+    return result
@@ -0,0 +1,186 @@
+"""
+Related tags and related suggestions.
+
+Both are precomputed when suggestions are saved, so that the detail
+pages only get one entity. RelatedTags rows count how many
+suggestions each pair of tags shares. RelatedSuggestions keeps the
+TOP_K suggestions that share the most tags with each suggestion.
+rebuild() recomputes everything from all suggestions.
+"""
+from google.appengine.ext import db
+
+from reminders.models import Reminder
+from tags.models import TagMember, RelatedTags, RelatedSuggestions, tag_key
+from suggestions import version
+
+TOP_K = 10
+ROW_SIZE = 200 # Keep the rows small, the top entries are what counts.
+CANDIDATE_LIMIT = 100 # Members per tag to compare with a new suggestion.
+BATCH_SIZE = 100
+
+
+def sort_row(pairs, size):
+    """
+    Sort (name, count) pairs by count, biggest first, and drop empty
+    and excess entries.
+    """
+    pairs = sorted((-count, name) for name, count in pairs if count > 0)
+    pairs = pairs[:size]
+    return ([name for count, name in pairs],
+            [-count for count, name in pairs])
+
+
+def tag_pairs(tag_names):
+    tag_names = sorted(set(tag_names))
+    for first in tag_names:
+        for second in tag_names:
+            if first != second:
+                yield first, second
+
+
+def update_tags(old_tags, new_tags):
+    """
+    Adjust the co-occurrence counts after the tags of one suggestion
+    changed from old_tags to new_tags, with one batch get and one
+    batch put.
+    """
+    update_many_tags([(old_tags, new_tags)])
+
+
+def update_many_tags(changes):
+    """
+    Same as update_tags for a list of (old_tags, new_tags) pairs.
+    """
+    deltas = {}
+    for old_tags, new_tags in changes:
+        for first, second in tag_pairs(old_tags):
+            row = deltas.setdefault(first, {})
+            row[second] = row.get(second, 0) - 1
+        for first, second in tag_pairs(new_tags):
+            row = deltas.setdefault(first, {})
+            row[second] = row.get(second, 0) + 1
+    tag_names = sorted(deltas)
+    if not tag_names:
+        return
+    rows = db.get([db.Key.from_path(RelatedTags.kind(), tag_name)
+                   for tag_name in tag_names])
+    changed = []
+    for tag_name, row in zip(tag_names, rows):
+        if row is None:
+            row = RelatedTags(key_name=tag_name)
+        counts = dict(zip(row.names, row.counts))
+        for other, delta in deltas[tag_name].items():
+            counts[other] = counts.get(other, 0) + delta
+        row.names, row.counts = sort_row(counts.items(), ROW_SIZE)
+        changed.append(row)
+    db.put(changed)
+
+
+def get_related_tags(tag_name, limit=TOP_K):
+    """
+    List of (tag name, shared suggestions) pairs.
+    """
+    row = RelatedTags.get_by_key_name(tag_name)
+    if row is None:
+        return []
+    return zip(row.names[:limit], row.counts[:limit])
+
+
+def update_suggestion(suggestion):
+    """
+    Find the suggestions that share tags with this one, save its top
+    list, and add it to their top lists where it fits.
+    """
+    slug = suggestion.key().name()
+    candidates = set()
+    for tag_name in set(suggestion.tags):
+        query = TagMember.all(keys_only=True).ancestor(tag_key(tag_name))
+        candidates.update(key.name() for key in query.fetch(CANDIDATE_LIMIT))
+    candidates.discard(slug)
+    candidates = sorted(candidates)
+    if not candidates:
+        return
+    keys = ([db.Key.from_path(Reminder.kind(), name) for name in candidates]
+            + [db.Key.from_path(RelatedSuggestions.kind(), name)
+               for name in candidates])
+    entities = db.get(keys)
+    others = entities[:len(candidates)]
+    rows = entities[len(candidates):]
+    tags = set(suggestion.tags)
+    scores = []
+    changed = []
+    for name, other, row in zip(candidates, others, rows):
+        if other is None:
+            continue
+        score = len(tags.intersection(other.tags))
+        scores.append((name, score))
+        if row is None:
+            row = RelatedSuggestions(key_name=name)
+        pairs = [pair for pair in zip(row.names, row.scores)
+                 if pair[0] != slug]
+        pairs.append((slug, score))
+        names, row_scores = sort_row(pairs, TOP_K)
+        if names != row.names or row_scores != row.scores:
+            row.names, row.scores = names, row_scores
+            changed.append(row)
+    row = RelatedSuggestions(key_name=slug)
+    row.names, row.scores = sort_row(scores, TOP_K)
+    db.put([row] + changed)
+
+
+def get_related_suggestions(slug, limit=TOP_K):
+    """
+    Key names of the suggestions that share the most tags with this
+    one.
+    """
+    row = RelatedSuggestions.get_by_key_name(slug)
+    if row is None:
+        return []
+    return row.names[:limit]
+
+
+def rebuild():
+    """
+    Recompute all rows from all suggestions. Returns the number of
+    suggestions.
+    """
+    suggestion_tags = {}
+    query = Reminder.all().filter('owner', None)
+    suggestion_list = query.fetch(BATCH_SIZE)
+    while suggestion_list:
+        for suggestion in suggestion_list:
+            suggestion_tags[suggestion.key().name()] = set(suggestion.tags)
+        if len(suggestion_list) < BATCH_SIZE:
+            break
+        query.with_cursor(query.cursor())
+        suggestion_list = query.fetch(BATCH_SIZE)
+    tag_counts = {}
+    members = {}
+    for slug, tags in suggestion_tags.items():
+        for first, second in tag_pairs(tags):
+            row = tag_counts.setdefault(first, {})
+            row[second] = row.get(second, 0) + 1
+        for tag_name in tags:
+            members.setdefault(tag_name, set()).add(slug)
+    rows = []
+    for tag_name, counts in tag_counts.items():
+        row = RelatedTags(key_name=tag_name)
+        row.names, row.counts = sort_row(counts.items(), ROW_SIZE)
+        rows.append(row)
+    for slug, tags in suggestion_tags.items():
+        scores = {}
+        for tag_name in tags:
+            for other in members[tag_name]:
+                if other != slug:
+                    scores[other] = scores.get(other, 0) + 1
+        row = RelatedSuggestions(key_name=slug)
+        row.names, row.scores = sort_row(scores.items(), TOP_K)
+        rows.append(row)
+    old_keys = (list(RelatedTags.all(keys_only=True)) +
+                list(RelatedSuggestions.all(keys_only=True)))
+    for start in range(0, len(old_keys), BATCH_SIZE):
+        db.delete(old_keys[start:start + BATCH_SIZE])
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.put(rows[start:start + BATCH_SIZE])
+    version.bump()
+    return len(suggestion_tags)
@@ -0,0 +1,424 @@
+import time
+from datetime import datetime, timedelta
+
+from google.appengine.api import memcache
+from google.appengine.ext import db
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from reminders.models import Reminder
+from tags.models import Tag, TagMember, TagCloud, TagMerge, TagAlias
+from tags.models import CloudChange
+from tags.models import HourlyActivity, DailyActivity
+from tags import cloud, related, autocomplete, merge, normalize
+from tags import trending, models
+from suggestions import summary, catalog
+
+
+class ClientTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+
+    def test_index(self):
+        Tag(key_name='home', count=2, suggestions=['a', 'b']).put()
+        cloud.rebuild()
+        response = self.client.get('/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('font-size:16px' in response.content)
+        self.assertTrue('<a href="/tags/home/"' in response.content)
+
+    def test_reserved_names(self):
+        catalog._local['catalog'] = None
+        for name in ('trending', 'cloud', 'merge', 'autocomplete'):
+            Tag(key_name=name, count=1).put()
+            response = self.client.get('/tags/%s/' % name)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue('suggestion_list' in response.context)
+
+
+class CountTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+
+    def test_total(self):
+        tag = Tag(key_name='home', count=2)
+        tag.put()
+        tag.increment()
+        tag.increment()
+        self.assertEqual(tag.get_total(), 4)
+        self.assertEqual(Tag.get_by_key_name('home').count, 2)
+        self.assertEqual(tag.get_font_size(), '18px')
+
+    def test_set_count(self):
+        tag = Tag(key_name='home', count=2)
+        tag.put()
+        tag.increment()
+        tag.set_count(5)
+        tag = Tag.get_by_key_name('home')
+        self.assertEqual(tag.count, 5)
+        self.assertEqual(tag.get_total(), 5)
+        tag.set_count(0)
+        self.assertEqual(Tag.get_by_key_name('home'), None)
+
+
+class MemberTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+        for slug in 'a-b b-c c-d'.split():
+            Reminder(key_name=slug, title=slug, tags=['home']).put()
+
+    def test_migrate(self):
+        Tag(key_name='home', count=3, suggestions='c-d a-b c-d'.split()).put()
+        response = self.client.get('/tags/home/')
+        self.assertEqual([suggestion.key_name for suggestion in
+                          response.context['suggestion_list']],
+                         ['a-b', 'c-d'])
+        tag = Tag.get_by_key_name('home')
+        tag.migrate()
+        tag = Tag.get_by_key_name('home')
+        self.assertEqual(tag.suggestions, [])
+        self.assertEqual(tag.get_member_names(), ['a-b', 'c-d'])
+
+    def test_migrate_batches(self):
+        slugs = ['slug-%d' % index for index in range(5)]
+        tag = Tag(key_name='home', count=5, suggestions=slugs)
+        tag.put()
+        models.MIGRATE_BATCH_SIZE, batch_size = 2, models.MIGRATE_BATCH_SIZE
+        try:
+            tag.migrate()
+        finally:
+            models.MIGRATE_BATCH_SIZE = batch_size
+        self.assertEqual(tag.suggestions, [])
+        tag = Tag.get_by_key_name('home')
+        self.assertEqual(tag.suggestions, [])
+        self.assertEqual(tag.get_member_names(), slugs)
+
+    def test_members(self):
+        tag = Tag(key_name='home', count=3)
+        tag.put()
+        for slug in 'c-d b-c a-b'.split():
+            tag.add_member(slug)
+        self.assertEqual(TagMember.all().count(), 3)
+        tag.remove_member('b-c')
+        self.assertEqual(sorted(tag.get_member_names()), ['a-b', 'c-d'])
+
+    def test_cursor(self):
+        tag = Tag(key_name='home', count=3)
+        tag.put()
+        for slug in 'c-d b-c a-b'.split():
+            tag.add_member(slug)
+        suggestion_list, cursor = tag.get_suggestions(limit=2)
+        self.assertEqual([suggestion.key_name for suggestion in
+                          suggestion_list], ['a-b', 'b-c'])
+        self.assertEqual(cursor, 'b-c')
+        suggestion_list, cursor = tag.get_suggestions(cursor, limit=2)
+        self.assertEqual([suggestion.key_name for suggestion in
+                          suggestion_list], ['c-d'])
+        self.assertEqual(cursor, None)
+        response = self.client.get('/tags/home/', {'cursor': 'b-c'})
+        self.assertEqual([suggestion.key_name for suggestion in
+                          response.context['suggestion_list']], ['c-d'])
+        self.assertEqual(response.context['cursor'], None)
+        response = self.client.get('/tags/work/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_new_tag(self):
+        catalog.get_catalog()
+        # Created after the snapshot was built.
+        tag = Tag(key_name='home', count=1)
+        tag.put()
+        tag.add_member('a-b')
+        response = self.client.get('/tags/home/')
+        self.assertEqual([suggestion.key_name for suggestion in
+                          response.context['suggestion_list']], ['a-b'])
+
+    def test_migrate_view(self):
+        Tag(key_name='home', count=1, suggestions=['a-b']).put()
+        Tag(key_name='work', count=1, suggestions=['b-c']).put()
+        response = self.client.get('/tags/_admin/migrate/')
+        self.assertRedirects(response,
+                             '/accounts/login/?next=/tags/_admin/migrate/')
+        response = self.client.get('/tags/_admin/migrate/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Migrated 2 tags, finished." in response.content)
+        self.assertEqual(TagMember.all().count(), 2)
+        self.assertEqual(Tag.get_by_key_name('work').get_member_names(),
+                         ['b-c'])
+
+    def test_summaries(self):
+        suggestion_list = summary.get_summaries(['a-b'])
+        self.assertEqual([unicode(item) for item in suggestion_list], ['a-b'])
+        # The second call uses the cached summary.
+        Reminder(key_name='a-b', title='changed', tags=['home']).put()
+        suggestion_list = summary.get_summaries(['a-b'])
+        self.assertEqual([unicode(item) for item in suggestion_list], ['a-b'])
+        summary.invalidate(['a-b'])
+        suggestion_list = summary.get_summaries(['a-b'])
+        self.assertEqual([unicode(item) for item in suggestion_list],
+                         ['changed'])
+
+
+class CloudTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+
+    def test_snapshot(self):
+        Tag(key_name='home', count=2).put()
+        Tag(key_name='work', count=1).put()
+        # Requests never build the snapshot.
+        self.assertEqual(cloud.get_cloud(), [])
+        cloud.update()
+        self.assertEqual(cloud.get_cloud(), [('home', 2, '16px'),
+                                             ('work', 1, '15px')])
+        # Counter changes don't write the snapshot, the update does.
+        Tag.get_by_key_name('work').increment(3)
+        tag = Tag(key_name='garden', count=0)
+        tag.put()
+        tag.increment()
+        tag.increment()
+        Tag.get_by_key_name('home').set_count(0)
+        self.assertEqual(TagCloud.get_by_key_name('cloud').names,
+                         ['home', 'work'])
+        self.assertEqual(CloudChange.all().count(), 3)
+        self.assertEqual(cloud.update(), 3)
+        self.assertEqual(CloudChange.all().count(), 0)
+        self.assertEqual(cloud.get_cloud(), [('garden', 2, '16px'),
+                                             ('work', 4, '18px')])
+        self.assertEqual(cloud.update(), 0)
+
+    def test_full_cloud(self):
+        cloud.CLOUD_SIZE, cloud_size = 1, cloud.CLOUD_SIZE
+        try:
+            Tag(key_name='home', count=2).put()
+            Tag(key_name='work', count=1).put()
+            cloud.rebuild()
+            Tag.get_by_key_name('work').increment(3)
+            cloud.update()
+        finally:
+            cloud.CLOUD_SIZE = cloud_size
+        self.assertEqual(cloud.get_cloud(), [('work', 4, '18px')])
+
+    def test_views(self):
+        Tag(key_name='home', count=2).put()
+        response = self.client.get('/tags/_admin/cloud/rebuild/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Rebuilt tag cloud with 1 tags." in response.content)
+        Tag.get_by_key_name('home').increment()
+        response = self.client.get('/tags/_admin/cloud/',
+                                   HTTP_X_APPENGINE_CRON='true')
+        self.assertTrue("Updated tag cloud with 1 changed tags."
+                        in response.content)
+
+
+class RelatedTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+
+    def add(self, slug, tag_names):
+        suggestion = Reminder(key_name=slug, title=slug, tags=tag_names)
+        suggestion.put()
+        for tag_name in tag_names:
+            tag = Tag.get_by_key_name(tag_name) or Tag(key_name=tag_name,
+                                                       count=0)
+            tag.put()
+            tag.add_member(slug)
+        related.update_tags([], tag_names)
+        related.update_suggestion(suggestion)
+
+    def test_related(self):
+        self.add('a', ['home', 'safety', 'fire'])
+        self.add('b', ['home', 'safety'])
+        self.add('c', ['home', 'garden'])
+        self.assertEqual(related.get_related_tags('home'),
+                         [('safety', 2), ('fire', 1), ('garden', 1)])
+        self.assertEqual(related.get_related_tags('garden'), [('home', 1)])
+        self.assertEqual(related.get_related_suggestions('a'), ['b', 'c'])
+        self.assertEqual(related.get_related_suggestions('c'), ['a', 'b'])
+        response = self.client.get('/tags/home/')
+        self.assertTrue('<a href="/tags/safety/">safety</a>'
+                        in response.content)
+        response = self.client.get('/suggestions/c/')
+        self.assertTrue('<a href="/suggestions/a/">a</a>' in response.content)
+
+    def test_rebuild(self):
+        self.add('a', ['home', 'safety', 'fire'])
+        self.add('b', ['home', 'safety'])
+        tag_rows = related.get_related_tags('home')
+        suggestion_rows = related.get_related_suggestions('b')
+        self.assertEqual(related.rebuild(), 2)
+        self.assertEqual(related.get_related_tags('home'), tag_rows)
+        self.assertEqual(related.get_related_suggestions('b'),
+                         suggestion_rows)
+
+
+class AutocompleteTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+        catalog._local['catalog'] = None
+        autocomplete._local['loaded'] = 0
+        for name, count in (('garage', 1), ('garden', 3), ('gas', 2),
+                            ('home', 5)):
+            tag = Tag(key_name=name, count=count)
+            tag.put()
+            for index in range(count):
+                tag.add_member('slug-%d' % index)
+
+    def test_lookup(self):
+        self.assertEqual(autocomplete.lookup('ga'),
+                         [('garden', 3), ('gas', 2), ('garage', 1)])
+        self.assertEqual(autocomplete.lookup('gar', limit=1),
+                         [('garden', 3)])
+        self.assertEqual(autocomplete.lookup('x'), [])
+        self.assertEqual(autocomplete.lookup(''), [])
+
+    def test_snapshot(self):
+        autocomplete.lookup('h')
+        tag = Tag(key_name='hobby', count=1)
+        tag.put()
+        tag.add_member('slug-0')
+        # The stale index is served until cron builds a new catalog.
+        autocomplete._local['loaded'] = 0
+        self.assertEqual(autocomplete.lookup('ho'), [('home', 5)])
+        catalog.rebuild()
+        autocomplete._local['loaded'] = 0
+        self.assertEqual(autocomplete.lookup('ho'),
+                         [('home', 5), ('hobby', 1)])
+
+    def test_json(self):
+        response = self.client.get('/tags/_autocomplete/', {'q': 'Ga'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertTrue('"name": "garden"' in response.content)
+
+
+class MergeTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+        old = datetime(2009, 1, 1)
+        Tag(key_name='auto', count=2, created=old).put()
+        Tag(key_name='car', count=1).put()
+        for slug, tag_names in (('wash-auto', ['auto']),
+                                ('tires', ['auto', 'car']),
+                                ('oil', ['car'])):
+            Reminder(key_name=slug, title=slug, tags=tag_names).put()
+            for tag_name in tag_names:
+                Tag.get_by_key_name(tag_name).add_member(slug)
+        self.user = User.objects.create_user('user', 'user@example.com',
+                                             'pass')
+        Reminder(owner=self.user, title='Wash', tags=['auto']).put()
+
+    def test_merge(self):
+        job = merge.start('auto', 'car')
+        self.assertTrue(merge.run(job, time.time() + 10))
+        self.assertEqual(job.moved, 3)
+        self.assertEqual(Tag.get_by_key_name('auto'), None)
+        car = Tag.get_by_key_name('car')
+        self.assertEqual(car.get_total(), 3)
+        self.assertEqual(car.created, datetime(2009, 1, 1))
+        self.assertEqual(sorted(car.get_member_names()),
+                         ['oil', 'tires', 'wash-auto'])
+        self.assertEqual(Reminder.get_by_key_name('tires').tags, ['car'])
+        self.assertEqual(Reminder.all().filter('tags', 'auto').count(), 0)
+
+    def test_normalized_target(self):
+        job = merge.start('auto', 'Cars')
+        self.assertEqual(job.target, 'car')
+
+    def test_resume(self):
+        merge.CHUNK_SIZE, chunk_size = 1, merge.CHUNK_SIZE
+        try:
+            job = merge.start('auto', 'automobile')
+            self.assertFalse(merge.run(job, 0))
+            job = TagMerge.get_by_id(job.key().id())
+            while not merge.run(job, time.time() + 10):
+                pass
+        finally:
+            merge.CHUNK_SIZE = chunk_size
+        self.assertEqual(Tag.get_by_key_name('automobile').get_total(), 2)
+        self.assertEqual(Reminder.get_by_key_name('tires').tags,
+                         ['automobile', 'car'])
+
+
+class NormalizeTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+        normalize.invalidate()
+
+    def test_normalize(self):
+        self.assertEqual(normalize.normalize('Cars'), 'car')
+        self.assertEqual(normalize.normalize('batteries'), 'battery')
+        self.assertEqual(normalize.normalize('glasses'), 'glass')
+        self.assertEqual(normalize.normalize('glass'), 'glass')
+        self.assertEqual(normalize.normalize('bus'), 'bus')
+        self.assertEqual(normalize.normalize('gas'), 'gas')
+        self.assertEqual(normalize.normalize('Wi-Fi!'), 'wifi')
+        self.assertEqual(normalize.normalize_tags('Car cars  CAR -- home'),
+                         ['car', 'home'])
+
+    def test_alias(self):
+        TagAlias(key_name='auto', target='car').put()
+        TagAlias(key_name='news', target='news').put()
+        normalize.invalidate()
+        self.assertEqual(normalize.normalize_tags('Autos auto news'),
+                         ['car', 'news'])
+
+
+class TrendingTest(TestCase):
+
+    def setUp(self):
+        memcache.flush_all()
+
+    def test_trending(self):
+        now = datetime(2010, 3, 10, 12, 0)
+        trending.record(['home', 'safety'], now)
+        trending.record(['home'], now - timedelta(hours=3))
+        trending.record(['car'], now - timedelta(hours=30))
+        for day in range(2, 6):
+            trending.record(['safety'], now - timedelta(days=day))
+        self.assertEqual(trending.get_trending(now),
+                         [('home', 2, 0), ('safety', 1, 4)])
+        # Page views don't write, the cron job rolls up complete days.
+        self.assertEqual(DailyActivity.all().count(), 0)
+        trending.cleanup(now)
+        self.assertEqual(DailyActivity.all().count(), trending.DAYS)
+        self.assertEqual(HourlyActivity.get_by_key_name('2010031009').names,
+                         ['home'])
+        memcache.flush_all()
+        self.assertEqual(trending.get_trending(now),
+                         [('home', 2, 0), ('safety', 1, 4)])
+        # Cached for a few minutes.
+        trending.record(['car'], now)
+        self.assertEqual(trending.get_trending(now),
+                         [('home', 2, 0), ('safety', 1, 4)])
+        self.assertEqual(DailyActivity.get_by_key_name('20100309').names,
+                         ['car'])
+
+    def test_cleanup(self):
+        now = datetime(2010, 3, 10, 12, 0)
+        trending.record(['home'], now - timedelta(days=10))
+        trending.record(['home'], now)
+        self.assertEqual(trending.cleanup(now), 1)
+        old_shards = db.get(trending.hour_keys(
+                trending.hour_name(now - timedelta(days=10))))
+        self.assertEqual(old_shards, [None] * trending.HOUR_SHARDS)
+        shards = db.get(trending.hour_keys(trending.hour_name(now)))
+        self.assertEqual(len([shard for shard in shards if shard]), 1)
+
+    def test_create_reminder(self):
+        Reminder(key_name='water-plants', title="Water plants",
+                 tags=['garden'], days=3).put()
+        User.objects.create_user('user', 'user@example.com', 'pass')
+        self.assertTrue(self.client.login(username='user@example.com',
+                                          password='pass'))
+        self.client.post('/suggestions/water-plants/')
+        response = self.client.get('/tags/_trending/')
+        self.assertTrue('<a href="/tags/garden/">garden</a>'
+                        in response.content)
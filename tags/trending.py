@@ -0,0 +1,177 @@
+"""
+Trending tags, from time-bucketed activity counters.
+
+record() adds one to each tag of a new reminder in a random shard
+of the bucket of the current hour, so that concurrent writers rarely
+meet in the same entity group. The hourly cron job rolls the shards
+of each past hour up into one entity, and complete days into one
+daily bucket. The trending list then reads 24 hourly entities, the
+shards of the last hour or two, and 7 daily entities, and is cached
+for a few minutes. Tags are ranked by the last 24 hours compared to
+the daily average of the week before.
+"""
+import random
+from datetime import timedelta
+
+from google.appengine.api import memcache
+from google.appengine.ext import db
+
+from tags.models import HourlyActivity, DailyActivity
+
+DAYS = 7
+KEEP_DAYS = 8 # Hourly buckets older than this are deleted by cleanup().
+HOUR_SHARDS = 10
+ROLL_UP_HOURS = 48 # cleanup() rolls up the hours in this window.
+GET_BATCH_SIZE = 500
+LIMIT = 20
+CACHE_KEY = 'trending-tags:%s'
+CACHE_TIME = 300 # Seconds.
+
+
+def hour_name(when):
+    return when.strftime('%Y%m%d%H')
+
+
+def hour_keys(prefix):
+    """
+    Keys of all shards of one hour, given as YYYYMMDDHH.
+    """
+    return [db.Key.from_path(HourlyActivity.kind(),
+                             '%s/%d' % (prefix, shard))
+            for shard in range(HOUR_SHARDS)]
+
+
+def day_name(when):
+    return when.strftime('%Y%m%d')
+
+
+def add_counts(bucket, counts):
+    totals = dict(zip(bucket.names, bucket.counts))
+    for name, count in counts.items():
+        totals[name] = totals.get(name, 0) + count
+    bucket.names = sorted(totals)
+    bucket.counts = [totals[name] for name in bucket.names]
+
+
+def record(tag_names, now):
+    """
+    Count one new reminder for each of these tags.
+    """
+    counts = dict((tag_name, 1) for tag_name in tag_names)
+    if not counts:
+        return
+    shard = random.randint(0, HOUR_SHARDS - 1)
+    key_name = '%s/%d' % (hour_name(now), shard)
+
+    def txn():
+        bucket = HourlyActivity.get_by_key_name(key_name)
+        if bucket is None:
+            bucket = HourlyActivity(key_name=key_name)
+        add_counts(bucket, counts)
+        bucket.put()
+    db.run_in_transaction(txn)
+
+
+def sum_buckets(bucket_list):
+    totals = {}
+    for bucket in bucket_list:
+        if bucket is not None:
+            for name, count in zip(bucket.names, bucket.counts):
+                totals[name] = totals.get(name, 0) + count
+    return totals
+
+
+def get_hours(names, save=False):
+    """
+    Totals of these hours, given as YYYYMMDDHH. Hours that were
+    rolled up are one entity each, the others are summed from their
+    shards, and saved as rolled up if save is true.
+    """
+    hour_list = db.get([db.Key.from_path(HourlyActivity.kind(), name)
+                        for name in names])
+    missing = [name for name, hour in zip(names, hour_list) if hour is None]
+    if missing:
+        keys = []
+        for name in missing:
+            keys.extend(hour_keys(name))
+        shard_list = []
+        for start in range(0, len(keys), GET_BATCH_SIZE):
+            shard_list.extend(db.get(keys[start:start + GET_BATCH_SIZE]))
+        rolled_up = []
+        for index, name in enumerate(missing):
+            hour = HourlyActivity(key_name=name)
+            add_counts(hour, sum_buckets(
+                    shard_list[index * HOUR_SHARDS:
+                               (index + 1) * HOUR_SHARDS]))
+            rolled_up.append(hour)
+        if save:
+            db.put(rolled_up)
+        hour_list = [hour for hour in hour_list if hour is not None]
+        hour_list.extend(rolled_up)
+    return sum_buckets(hour_list)
+
+
+def get_last_hours(now, hours=24):
+    return get_hours([hour_name(now - timedelta(hours=hour))
+                      for hour in range(hours)])
+
+
+def get_days(now, days=DAYS, save=False):
+    """
+    Totals of the complete days before today. Days that were not
+    rolled up yet are computed from their hours, and saved only if
+    save is true, so that page views never write.
+    """
+    dates = [now - timedelta(days=day) for day in range(1, days + 1)]
+    day_list = db.get([db.Key.from_path(DailyActivity.kind(), day_name(date))
+                       for date in dates])
+    missing = [date for date, day in zip(dates, day_list) if day is None]
+    rolled_up = []
+    for date in missing:
+        day = DailyActivity(key_name=day_name(date))
+        add_counts(day, get_hours([day_name(date) + '%02d' % hour
+                                   for hour in range(24)]))
+        rolled_up.append(day)
+    if save and rolled_up:
+        db.put(rolled_up)
+    day_list = [day for day in day_list if day is not None] + rolled_up
+    return sum_buckets(day_list)
+
+
+def get_trending(now, limit=LIMIT):
+    """
+    List of (tag name, last 24 hours, last week) tuples, most
+    trending first, cached for CACHE_TIME seconds.
+    """
+    cache_key = CACHE_KEY % hour_name(now)
+    trending_list = memcache.get(cache_key)
+    if trending_list is not None:
+        return trending_list[:limit]
+    recent = get_last_hours(now)
+    week = get_days(now)
+    ranked = []
+    for name, count in recent.items():
+        average = float(week.get(name, 0)) / DAYS
+        ranked.append(((count + 1) / (average + 1), count, name))
+    ranked.sort(reverse=True)
+    trending_list = [(name, count, week.get(name, 0))
+                     for score, count, name in ranked[:LIMIT]]
+    memcache.set(cache_key, trending_list, time=CACHE_TIME)
+    return trending_list[:limit]
+
+
+def cleanup(now):
+    """
+    Roll up the shards of the hours before the last one and the
+    complete days, and delete old hourly buckets. Returns the number
+    of deleted buckets.
+    """
+    get_hours([hour_name(now - timedelta(hours=hour))
+               for hour in range(2, ROLL_UP_HOURS)], save=True)
+    get_days(now, save=True)
+    cutoff = db.Key.from_path(HourlyActivity.kind(), hour_name(
+            now - timedelta(days=KEEP_DAYS)))
+    keys = HourlyActivity.all(keys_only=True).filter(
+        '__key__ <', cutoff).fetch(500)
+    db.delete(keys)
+    return len(keys)
@@ -1,6 +1,17 @@
 from django.conf.urls.defaults import *
 
+# Tag names are [a-z0-9]+, so the other pages live under a leading
+# underscore and can never hide a tag's detail page.
 urlpatterns = patterns('tags.views',
     url(r'^$', 'index'),
+    url(r'^_autocomplete/$', 'complete'),
+    url(r'^_trending/$', 'trending_tags'),
+    url(r'^_admin/cloud/$', 'update_cloud'),
+    url(r'^_admin/cloud/rebuild/$', 'rebuild_cloud'),
+    url(r'^_admin/merge/$', 'merge_tags'),
+    url(r'^_admin/merge/(?P<job_id>\d+)/$', 'merge_status'),
+    url(r'^_admin/migrate/$', 'migrate'),
+    url(r'^_admin/related/$', 'rebuild_related'),
+    url(r'^_admin/trending/cleanup/$', 'trending_cleanup'),
     url(r'^(?P<key_name>[a-z0-9]+)/$', 'detail'),
 )
@@ -1,18 +1,183 @@
-from django.http import HttpResponseRedirect
+import time
+from datetime import datetime
+
+from django import forms
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils import simplejson
 
 from ragendja.template import render_to_response
 from ragendja.dbutils import get_object_or_404
+from ragendja.auth.decorators import staff_only
+
+from utils.cron import cron_or_staff, TIME_BUDGET
+from tags.models import Tag, TagMerge, PAGE_SIZE
+from suggestions import popularity, catalog
+from tags import cloud, related, autocomplete, merge, trending
+from tags.normalize import normalize
 
-from tags.models import Tag
+BATCH_SIZE = 50
+POPULAR_LIMIT = 5
 
 
 def index(request):
-    tag_list = list(Tag.all().order('-count').fetch(100))
-    tag_list.sort(key=lambda tag: tag.key().name())
+    tag_list = cloud.get_cloud()
     return render_to_response(request, 'tags/index.html', locals())
 
 
+def trending_tags(request):
+    """
+    Tags with the most new reminders in the last 24 hours, compared
+    to the week before.
+    """
+    trending_list = trending.get_trending(datetime.now())
+    return render_to_response(request, 'tags/trending.html', locals())
+
+
+@cron_or_staff
+def trending_cleanup(request):
+    """
+    Roll up the trending counters and delete old hourly buckets,
+    called by cron.
+    """
+    deleted = trending.cleanup(datetime.now())
+    return HttpResponse("Deleted %d hourly buckets.\n" % deleted,
+                        mimetype="text/plain")
+
+
+@cron_or_staff
+def update_cloud(request):
+    """
+    Apply the changed tag totals to the tag cloud, called by cron.
+    """
+    count = cloud.update()
+    return HttpResponse("Updated tag cloud with %d changed tags.\n" %
+                        count, mimetype="text/plain")
+
+
+@cron_or_staff
+def rebuild_cloud(request):
+    """
+    Recompute the tag cloud snapshot from all tags, called by cron.
+    """
+    snapshot = cloud.rebuild()
+    return HttpResponse("Rebuilt tag cloud with %d tags.\n" %
+                        len(snapshot.names), mimetype="text/plain")
+
+
+def complete(request):
+    """
+    Existing tags that start with the last typed word, as JSON.
+    """
+    data = {'tags': [{'name': name, 'count': count} for name, count in
+                     autocomplete.lookup(request.GET.get('q', ''))]}
+    return HttpResponse(simplejson.dumps(data),
+                        mimetype='application/json')
+
+
 def detail(request, key_name):
-    tag = get_object_or_404(Tag, key_name=key_name)
-    suggestion_list = tag.get_suggestions()
+    """
+    One page of a tag's suggestions, served from the catalog snapshot
+    without datastore calls. Tags created after the last snapshot
+    build are read from their members until the next build.
+    """
+    snapshot = catalog.get_catalog()
+    tag = snapshot.tags.get(key_name)
+    if tag is not None:
+        suggestion_list, cursor = snapshot.get_tag_page(
+            key_name, request.GET.get('cursor'), PAGE_SIZE)
+    else:
+        tag = get_object_or_404(Tag, key_name=key_name)
+        suggestion_list, cursor = tag.get_suggestions(
+            request.GET.get('cursor'))
+    related_tags = snapshot.related_tags.get(key_name, [])
+    popular_list = snapshot.get_suggestions(
+        popularity.get_popular_in_tag(key_name, POPULAR_LIMIT))
     return render_to_response(request, 'tags/detail.html', locals())
+
+
+@cron_or_staff
+def migrate(request):
+    """
+    Move the old suggestions lists of all tags to TagMember entities.
+    Run it again until it reports that nothing is left.
+    """
+    deadline = time.time() + TIME_BUDGET
+    query = Tag.all()
+    if request.GET.get('cursor'):
+        query.with_cursor(request.GET['cursor'])
+    migrated = 0
+    while time.time() < deadline:
+        tag_list = query.fetch(BATCH_SIZE)
+        for tag in tag_list:
+            if tag.suggestions:
+                tag.migrate()
+                migrated += 1
+        if len(tag_list) < BATCH_SIZE:
+            return HttpResponse("Migrated %d tags, finished.\n" % migrated,
+                                mimetype="text/plain")
+        query.with_cursor(query.cursor())
+    return HttpResponse(
+        "Migrated %d tags, continue with /tags/_admin/migrate/?cursor=%s\n"
+        % (migrated, query.cursor()), mimetype="text/plain")
+
+
+@cron_or_staff
+def rebuild_related(request):
+    """
+    Recompute related tags and related suggestions from scratch.
+    """
+    count = related.rebuild()
+    return HttpResponse("Rebuilt related items for %d suggestions.\n" %
+                        count, mimetype="text/plain")
+
+
+class MergeForm(forms.Form):
+    source = forms.RegexField(regex=r'^[a-z0-9]+$', max_length=120,
+        widget=forms.TextInput(attrs={'class': 'text span-4'}))
+    target = forms.RegexField(regex=r'^[a-z0-9]+$', max_length=120,
+        widget=forms.TextInput(attrs={'class': 'text span-4'}))
+
+    def clean_target(self):
+        # Normal tag writes could never reach a target that isn't
+        # normalized.
+        target = normalize(self.cleaned_data['target'])
+        if not target:
+            raise forms.ValidationError("Invalid tag name.")
+        return target
+
+    def clean(self):
+        source = self.cleaned_data.get('source')
+        target = self.cleaned_data.get('target')
+        if source and Tag.get_by_key_name(source) is None:
+            raise forms.ValidationError("Tag %s does not exist." % source)
+        if source and source == target:
+            raise forms.ValidationError("Can't merge a tag into itself.")
+        return self.cleaned_data
+
+
+@staff_only
+def merge_tags(request):
+    """
+    Rename a tag, or merge it into another tag.
+    """
+    merge_form = MergeForm(request.POST or None)
+    if merge_form.is_valid():
+        job = merge.start(merge_form.cleaned_data['source'],
+                          merge_form.cleaned_data['target'])
+        merge.run(job, time.time() + TIME_BUDGET)
+        return HttpResponseRedirect('/tags/_admin/merge/%d/' %
+                                    job.key().id())
+    job_list = TagMerge.all().order('-created').fetch(5)
+    return render_to_response(request, 'tags/merge.html', locals())
+
+
+@staff_only
+def merge_status(request, job_id):
+    """
+    Progress of a merge, with a button to continue large merges.
+    """
+    job = get_object_or_404(TagMerge, id=int(job_id))
+    if request.method == 'POST' and job.status == 'running':
+        merge.run(job, time.time() + TIME_BUDGET)
+        return HttpResponseRedirect(request.path)
+    return render_to_response(request, 'tags/merge_status.html', locals())
@@ -0,0 +1,24 @@
+"""
+Helpers for views that cron calls, and that staff can open by hand.
+"""
+from django.conf import settings
+from django.http import HttpResponseRedirect
+from django.utils.http import urlquote
+
+TIME_BUDGET = 20 # Seconds, well below the request deadline.
+
+
+def cron_or_staff(view):
+    """
+    Allow requests from cron and from staff users, and send everybody
+    else to the login page.
+    """
+    def wrapper(request, *args, **kwargs):
+        if (request.META.get('HTTP_X_APPENGINE_CRON', '') != 'true'
+            and not request.user.is_staff):
+            return HttpResponseRedirect('%s?next=%s' % (
+                    settings.LOGIN_URL, urlquote(request.path)))
+        return view(request, *args, **kwargs)
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper